@@ -0,0 +1,261 @@
+"""
+Load-test and latency benchmark for the names service.
+
+Drives the API in-process through the Flask test client and out-of-process against gunicorn
+started with the real src/gunicorn.conf.py, and reports throughput and p50/p95/p99 latency as
+JSON. Telemetry is exported to a local Application Insights stand-in, so no Azure resources are
+needed.
+
+Usage:
+    python benchmarks/run.py --modes inprocess,gunicorn --workers 1,4 --threads 1,4 --output results.json
+"""
+import argparse
+import datetime
+import http.client
+import itertools
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+TELEMETRY_ENV = {
+    "on": {"TRACE_SAMPLER": "always_on"},
+    "off": {"TRACE_SAMPLER": "always_off", "TRACE_ERRORS_ALWAYS_SAMPLED": "false"},
+}
+
+
+class IngestionHandler(BaseHTTPRequestHandler):
+    """
+    Accepts Application Insights track requests so the exporter can run without Azure.
+    """
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"itemsReceived": 0, "itemsAccepted": 0, "errors": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_ingestion_server():
+    """
+    Starts the local Application Insights stand-in and returns its connection string.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), IngestionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return (
+        "InstrumentationKey=00000000-0000-0000-0000-000000000000;"
+        f"IngestionEndpoint=http://127.0.0.1:{server.server_address[1]}"
+    )
+
+
+def summarize(latencies, elapsed, errors):
+    """
+    Returns the throughput and latency percentiles of a benchmark run.
+    """
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentiles[49] * 1000, 3),
+            "p95": round(percentiles[94] * 1000, 3),
+            "p99": round(percentiles[98] * 1000, 3),
+            "max": round(max(latencies) * 1000, 3),
+        },
+    }
+
+
+def drive(send, requests, concurrency):
+    """
+    Sends requests spread across concurrency threads and summarizes their latencies.
+
+    Args:
+        send (callable): Creates a per-thread request function returning the HTTP status code.
+        requests (int): The total number of requests to send.
+        concurrency (int): The number of concurrent client threads.
+    """
+    def run(count):
+        request = send()
+        latencies, errors = [], 0
+        for _ in range(count):
+            start = time.perf_counter()
+            status = request()
+            latencies.append(time.perf_counter() - start)
+            errors += status != 200
+        return latencies, errors
+
+    counts = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(run, counts))
+    elapsed = time.perf_counter() - start
+
+    return summarize([latency for latencies, _ in results for latency in latencies], elapsed,
+                     sum(errors for _, errors in results))
+
+
+def run_inprocess(args):
+    """
+    Benchmarks the Flask app through its test client in this process and prints JSON.
+    """
+    sys.path.insert(0, SRC_DIR)
+    from api import create_app
+
+    app = create_app()
+
+    def send():
+        client = app.test_client()
+        return lambda: client.get(args.path).status_code
+
+    drive(send, min(args.warmup, args.requests), args.concurrency)
+    print(json.dumps(drive(send, args.requests, args.concurrency)))
+
+
+def benchmark_inprocess(args, telemetry, connection_string):
+    """
+    Runs the in-process benchmark in a child interpreter so telemetry settings apply at import.
+    """
+    env = dict(os.environ, APPLICATIONINSIGHTS_CONNECTION_STRING=connection_string, **TELEMETRY_ENV[telemetry])
+    output = subprocess.check_output(
+        [sys.executable, __file__, "--inprocess-child", "--path", args.path, "--requests", str(args.requests),
+         "--concurrency", str(args.concurrency), "--warmup", str(args.warmup)],
+        env=env,
+        universal_newlines=True,
+    )
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark_gunicorn(args, telemetry, connection_string, workers, threads):
+    """
+    Starts gunicorn with the real gunicorn.conf.py and benchmarks it over HTTP keep-alive connections.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    env = dict(os.environ, APPLICATIONINSIGHTS_CONNECTION_STRING=connection_string, **TELEMETRY_ENV[telemetry])
+    server = subprocess.Popen(
+        ["gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}", "-w", str(workers), "--threads",
+         str(threads), "app:app"],
+        cwd=SRC_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        wait_for_port(port, args.startup_timeout)
+
+        def send():
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+            def request():
+                connection.request("GET", args.path)
+                response = connection.getresponse()
+                response.read()
+                return response.status
+
+            return request
+
+        drive(send, min(args.warmup, args.requests), args.concurrency)
+        return drive(send, args.requests, args.concurrency)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def wait_for_port(port, timeout):
+    """
+    Waits until a server accepts connections on the local port.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+
+    raise TimeoutError(f"Server did not start listening on port {port} within {timeout} seconds.")
+
+
+def parse_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", type=parse_list, default=["inprocess", "gunicorn"])
+    parser.add_argument("--telemetry", type=parse_list, default=["off", "on"])
+    parser.add_argument("--workers", type=lambda v: [int(i) for i in parse_list(v)], default=[4])
+    parser.add_argument("--threads", type=lambda v: [int(i) for i in parse_list(v)], default=[4])
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    parser.add_argument("--inprocess-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.inprocess_child:
+        run_inprocess(args)
+        return
+
+    connection_string = start_ingestion_server()
+    results = []
+
+    for mode, telemetry in itertools.product(args.modes, args.telemetry):
+        if mode == "inprocess":
+            layouts = [(None, None)]
+        else:
+            layouts = list(itertools.product(args.workers, args.threads))
+
+        for workers, threads in layouts:
+            print(f"Benchmarking {mode} telemetry={telemetry} workers={workers} threads={threads}...",
+                  file=sys.stderr)
+            if mode == "inprocess":
+                summary = benchmark_inprocess(args, telemetry, connection_string)
+            else:
+                summary = benchmark_gunicorn(args, telemetry, connection_string, workers, threads)
+
+            results.append({"mode": mode, "telemetry": telemetry, "workers": workers, "threads": threads,
+                            "path": args.path, "concurrency": args.concurrency, **summary})
+
+    report = {
+        "metadata": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as w_stream:
+            json.dump(report, w_stream, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,139 @@
 import os
 
 from flask import Flask
-from opencensus.ext.azure.trace_exporter import AzureExporter
-from opencensus.ext.flask.flask_middleware import FlaskMiddleware
-from opencensus.trace.samplers import ProbabilitySampler
+
+from . import admission, metrics
 
 app_insights_connection_string = os.getenv('APPLICATIONINSIGHTS_CONNECTION_STRING')
+trace_errors_always_sampled = os.getenv('TRACE_ERRORS_ALWAYS_SAMPLED', 'true').lower() == 'true'
 
 def create_app():
     flask = Flask(__name__)
 
-    from . import app
+    from . import app, health
     flask.register_blueprint(app.bp, threaded=True)
+    flask.register_blueprint(metrics.bp)
+    flask.register_blueprint(health.bp)
+
+    # The opencensus and Azure exporter stack is only imported and built when telemetry is enabled
+    if app_insights_connection_string:
+        init_telemetry(flask)
+
+    # Registered after the tracing middleware so its request hooks see every request
+    admission.from_env().register(flask, [app.bp.name])
+
+    return flask
+
+
+def init_telemetry(flask):
+    """
+    Wires Application Insights request tracing into the Flask app.
+
+    Args:
+        flask (Flask): The Flask app to trace.
+    """
+    from opencensus.ext.flask.flask_middleware import FlaskMiddleware
+
+    from . import telemetry
+
+    exporter = _build_telemetry_exporter()
+    excludelist_paths = telemetry.build_excludelist_paths()
     _ = FlaskMiddleware(\
         flask, \
-        exporter=AzureExporter(\
-        connection_string=app_insights_connection_string), \
-        sampler=ProbabilitySampler(rate=1.0)
+        excludelist_paths=excludelist_paths, \
+        exporter=exporter, \
+        sampler=telemetry.build_sampler()
     )
 
-    return flask
+    flask.extensions["telemetry_exporter"] = exporter
+
+    if trace_errors_always_sampled:
+        telemetry.register_error_sampling(flask, exporter, excludelist_paths)
+
+
+def create_asgi_app():
+    from .asgi import create_asgi_app as create_names_asgi_app
+
+    fastapi = create_names_asgi_app()
+
+    if app_insights_connection_string:
+        init_asgi_telemetry(fastapi)
+
+    return fastapi
+
+
+def init_asgi_telemetry(fastapi):
+    """
+    Wires the same Application Insights request tracing into the FastAPI app.
+
+    Args:
+        fastapi (FastAPI): The FastAPI app to trace.
+    """
+    from . import telemetry
+
+    exporter = _build_telemetry_exporter()
+    # Added last, so the tracing middleware wraps admission control and sees shed requests
+    telemetry.register_asgi_tracing(
+        fastapi,
+        exporter,
+        telemetry.build_sampler(),
+        telemetry.build_excludelist_paths(),
+        errors_always_sampled=trace_errors_always_sampled,
+    )
+
+    fastapi.state.telemetry_exporter = exporter
+
+
+def _build_telemetry_exporter():
+    """
+    Builds the Application Insights exporter and declares its queue metrics.
+    """
+    from opencensus.ext.azure.trace_exporter import AzureExporter
+
+    from . import telemetry
+
+    exporter = telemetry.build_exporter(lambda **options: AzureExporter(\
+        connection_string=app_insights_connection_string, **options))
+    metrics.registry.gauge(
+        "telemetry_export_queue_depth", "Spans waiting in the telemetry export queue.", lambda: len(exporter)
+    )
+    metrics.registry.gauge(
+        "telemetry_spans_dropped", "Spans dropped because the telemetry export queue was full.",
+        lambda: exporter.dropped
+    )
+
+    return exporter
+
+
+def warm_up(application=None):
+    """
+    Prepares a freshly started worker process so its first request isn't a cold one.
+
+    Fills the name pool and starts the per-process name pool, log, metrics and telemetry export
+    threads, which are otherwise started lazily by the first request.
+
+    Args:
+        application: The Flask or ASGI app served by the worker.
+    """
+    from . import app
+
+    app.name_pool.ensure_started()
+    app.name_pool.fill()
+    metrics.registry.ensure_started()
+
+    if app.log_handler is not None:
+        app.log_handler.ensure_started()
+
+    exporter = telemetry_exporter(application)
+    if exporter is not None:
+        exporter.ensure_started()
+
+
+def telemetry_exporter(application):
+    """
+    Returns the telemetry exporter of a Flask or ASGI app, or None when telemetry is disabled.
+    """
+    if hasattr(application, "extensions"):
+        return application.extensions.get("telemetry_exporter")
+
+    return getattr(getattr(application, "state", None), "telemetry_exporter", None)
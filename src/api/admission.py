@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from .metrics import registry
+
+OVERLOADED_MESSAGE = "Service overloaded, retry later."
+# Set by the ingress proxy to the time it received the request, as t=<seconds since the epoch>
+REQUEST_START_HEADER = "X-Request-Start"
+
+
+def queued_seconds(request_start, now=None):
+    """
+    Returns the number of seconds since the time in an X-Request-Start header value.
+
+    The time may be given in seconds, milliseconds or microseconds, with or without the t= prefix.
+
+    Returns:
+        float: The seconds the request has been queued, or None if the value is missing or invalid.
+    """
+    if not request_start:
+        return None
+
+    try:
+        start = float(request_start.strip().removeprefix("t="))
+    except ValueError:
+        return None
+
+    # Tell the units apart by magnitude, like the proxies that set the header do
+    if start > 1e14:
+        start /= 1e6
+    elif start > 1e11:
+        start /= 1e3
+
+    return max(0.0, (time.time() if now is None else now) - start)
+
+
+class AdmissionController:
+    """
+    Bounds the number of requests a worker process handles concurrently.
+
+    A request waits at most max_queue_wait seconds for one of max_in_flight slots. When no slot
+    frees up in time it is shed immediately with a 503 and a Retry-After header, so the Istio
+    VirtualService can retry it on another replica instead of letting it queue until timeout.
+
+    A gthread worker never runs more requests than it has threads, so under overload requests
+    queue in gunicorn before any request hook sees them. The queue wait is therefore counted from
+    the request's arrival at the ingress proxy, taken from its X-Request-Start header, when the
+    header is set.
+    """
+
+    def __init__(self, max_in_flight=32, max_queue_wait=0.1, retry_after=1):
+        """
+        Initializes a new instance of the AdmissionController class.
+
+        Args:
+            max_in_flight (int): The maximum number of requests handled at the same time.
+            max_queue_wait (float): The maximum number of seconds a request waits for a slot.
+            retry_after (int): The number of seconds sent in the Retry-After header of a 503.
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be greater than 0")
+
+        self.max_in_flight = max_in_flight
+        self.max_queue_wait = max_queue_wait
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.shed = 0
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+
+    def acquire(self, queued=0.0):
+        """
+        Waits for a free slot.
+
+        Args:
+            queued (float): The seconds the request already waited before it reached the app.
+
+        Returns:
+            bool: True if the request was admitted, False if it has to be shed.
+        """
+        remaining_wait = self.max_queue_wait - queued
+        admitted = remaining_wait > 0 and self._slots.acquire(timeout=remaining_wait)
+
+        with self._lock:
+            if admitted:
+                self.in_flight += 1
+            else:
+                self.shed += 1
+
+        return admitted
+
+    def release(self):
+        """
+        Frees the slot of an admitted request.
+        """
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def register_metrics(self):
+        """
+        Exposes the in-flight and shed request counts on /metrics.
+        """
+        registry.gauge("admission_in_flight", "Requests currently admitted.", lambda: self.in_flight)
+        registry.gauge("admission_shed", "Requests rejected with a 503 by admission control.", lambda: self.shed)
+
+    def register(self, flask, blueprints):
+        """
+        Applies admission control to the requests routed to the given blueprints.
+
+        The slot is released once per request when the request context is torn down. The slot of
+        a streamed response is instead released once its body is exhausted or closed, not when
+        the view returns.
+
+        Args:
+            flask (Flask): The Flask app.
+            blueprints (list[str]): The names of the blueprints to protect.
+        """
+        self.register_metrics()
+
+        @flask.before_request
+        def _admit():
+            if request.blueprint not in blueprints:
+                return None
+
+            if not self.acquire(queued_seconds(request.headers.get(REQUEST_START_HEADER)) or 0.0):
+                # Lets telemetry skip the error span of a shed request, since tracing it would add
+                # work exactly when the worker is overloaded
+                g.admission_shed = True
+                return jsonify({"error": OVERLOADED_MESSAGE}), 503, {"Retry-After": str(self.retry_after)}
+
+            g.admission_admitted = True
+            return None
+
+        @flask.after_request
+        def _hand_over_streamed(response):
+            if response.is_streamed and g.pop("admission_admitted", False):
+                response.response = _ReleasingIterable(response.response, self.release)
+
+            return response
+
+        @flask.teardown_request
+        def _release(_):
+            # Also runs when the view raised and after_request was skipped
+            if g.pop("admission_admitted", False):
+                self.release()
+
+
+class _ReleasingIterable:
+    """
+    Wraps a streamed response body and calls release exactly once, when the body is exhausted or
+    closed, whichever happens first.
+    """
+
+    def __init__(self, iterable, release):
+        self._iterable = iterable
+        self._release = release
+        self._released = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        try:
+            yield from self._iterable
+        finally:
+            self._release_once()
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, "close"):
+                self._iterable.close()
+        finally:
+            self._release_once()
+
+    def _release_once(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._release()
+
+
+def from_env():
+    """
+    Creates an AdmissionController configured from the ADMISSION_* environment variables.
+
+    gunicorn.conf.py defaults ADMISSION_MAX_IN_FLIGHT to the thread count of gthread workers.
+    """
+    return AdmissionController(
+        max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32")),
+        max_queue_wait=float(os.getenv("ADMISSION_MAX_QUEUE_WAIT", "0.1")),
+        retry_after=int(os.getenv("ADMISSION_RETRY_AFTER", "1")),
+    )
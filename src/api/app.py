@@ -1,25 +1,233 @@
+import json
 import logging
+import os
+import time
 
-from flask import jsonify, Blueprint
-from opencensus.trace import config_integration
-from opencensus.trace.samplers import AlwaysOnSampler
-from opencensus.trace.tracer import Tracer
-import randomname
+from contextlib import nullcontext
+from functools import lru_cache
+
+from flask import g, jsonify, request, Blueprint, Response
+from . import app_insights_connection_string, unique
+from .logs import configure_logging
+from .metrics import count_request, observe_generation_duration, observe_request_duration, registry
+from .names import generate_name, generate_names, iter_name_chunks, name_for_id
+from .pool import NamePool
+from .serializers import JSON_MIMETYPE, MIMETYPES, loads_json, serialize
 
 bp = Blueprint("names", __name__)
-config_integration.trace_integrations(['logging'])
-logging.basicConfig(format='%(asctime)s traceId=%(traceId)s spanId=%(spanId)s %(message)s')
-tracer = Tracer(sampler=AlwaysOnSampler())
+tracing_enabled = bool(app_insights_connection_string)
+
+if tracing_enabled:
+    from opencensus.trace import config_integration, execution_context
+
+    config_integration.trace_integrations(['logging'])
+
+log_handler = configure_logging(
+    '%(asctime)s traceId=%(traceId)s spanId=%(spanId)s %(message)s',
+    defaults={"traceId": "0" * 32, "spanId": "0" * 16},
+)
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+logger.setLevel(os.getenv("LOG_LEVEL", "DEBUG").upper())
+# With UNIQUE_NAMES enabled, the pool draws names no worker has handed out within the window
+name_filter = unique.from_env()
+name_pool = NamePool(
+    size=int(os.getenv("NAME_POOL_SIZE", "1024")),
+    refill_batch=int(os.getenv("NAME_POOL_REFILL_BATCH", "256")),
+    low_water=int(os.getenv("NAME_POOL_LOW_WATER")) if os.getenv("NAME_POOL_LOW_WATER") else None,
+    generator=generate_name if name_filter is None else name_filter.draw,
+    refill_observer=lambda seconds: observe_generation_duration(seconds, path="pool_refill"),
+)
+names_max_count = int(os.getenv("NAMES_MAX_COUNT", "10000"))
+names_stream_max_count = int(os.getenv("NAMES_STREAM_MAX_COUNT", "10000000"))
+names_stream_chunk_size = int(os.getenv("NAMES_STREAM_CHUNK_SIZE", "1000"))
+names_by_id_max_count = int(os.getenv("NAMES_BY_ID_MAX_COUNT", "10000"))
+cached_name_for_id = lru_cache(maxsize=int(os.getenv("NAMES_BY_ID_CACHE_SIZE", "65536")))(name_for_id)
+NDJSON_MIMETYPE = "application/x-ndjson"
+registry.gauge("name_pool_size", "Names currently held in the name pool.", lambda: len(name_pool))
+registry.gauge(
+    "name_pool_misses", "Names generated inline because the name pool was empty.", lambda: name_pool.misses
+)
+if name_filter is not None:
+    registry.gauge("unique_names_drawn", "Names drawn by the unique names filter.", lambda: name_filter.drawn)
+    registry.gauge(
+        "unique_names_redraws", "Names redrawn because they were taken within the window.",
+        lambda: name_filter.redraws,
+    )
+registry.gauge(
+    "names_by_id_cache_hits", "Names by ID served from the LRU cache.", lambda: cached_name_for_id.cache_info().hits
+)
+registry.gauge(
+    "names_by_id_cache_misses", "Names by ID hashed because they were not cached.",
+    lambda: cached_name_for_id.cache_info().misses,
+)
+registry.gauge(
+    "log_records_dropped",
+    "Log records dropped because the log queue was full.",
+    lambda: log_handler.dropped if log_handler is not None else 0,
+)
+
+
+def _span(name):
+    """
+    Returns a child span of the request trace, or a no-op context when tracing is disabled.
+    """
+    if not tracing_enabled:
+        return nullcontext()
+
+    return execution_context.get_opencensus_tracer().span(name=name)
+
+
+@bp.before_request
+def _start_request_timer():
+    g.request_start_time = time.perf_counter()
+
+
+@bp.after_request
+def _record_request_metrics(response):
+    registry.ensure_started()
+    route = request.url_rule.rule if request.url_rule is not None else request.path
+    count_request(route=route, method=request.method, status=response.status_code)
+
+    # Requests shed by admission control never reach the blueprint's before_request
+    if "request_start_time" in g:
+        observe_request_duration(time.perf_counter() - g.request_start_time, route=route)
+
+    return response
 
 @bp.route("/")
 def hello_world():
-    # Generate a random name including a first name and adjective
-    random_name = randomname.generate()
-    with tracer.span(name=__name__):
+    # Pop a pre-generated random name including a first name and adjective
+    random_name = name_pool.pop()
+    with _span(__name__):
         logger.info("Random Name Selected: - %s", random_name)
 
-    json = {"name": random_name}
+    return _render({"name": random_name})
+
+
+def _render(body):
+    """
+    Serializes a name response body to the media type preferred by the request's Accept header.
+
+    JSON is returned unless msgpack or plain text is preferred.
+    """
+    mimetype = request.accept_mimetypes.best_match(MIMETYPES, default=JSON_MIMETYPE)
+    response = Response(serialize(body, mimetype), mimetype=mimetype)
+    response.vary.add("Accept")
+
+    return response
+
+
+def _parse_count_and_seed():
+    """
+    Parses the count and seed query arguments shared by the batch routes.
+
+    Returns:
+        A (count, seed) tuple. Raises ValueError if either argument is not an integer.
+    """
+    count = int(request.args.get("count", "1"))
+    seed = int(request.args["seed"]) if "seed" in request.args else None
+
+    return count, seed
+
+
+def _stream_names(count, seed):
+    """
+    Yields NDJSON encoded names in chunks of names_stream_chunk_size lines.
+
+    When the client disconnects, the WSGI server closes the response iterable, which raises
+    GeneratorExit here and stops generation before the next chunk is produced.
+    """
+    sent = 0
+    try:
+        for chunk in iter_name_chunks(count, names_stream_chunk_size, seed):
+            yield "".join(f'{{"name": {json.dumps(name)}}}\n' for name in chunk)
+            sent += len(chunk)
+    finally:
+        if sent < count:
+            logger.info("Name stream stopped early: - %d of %d", sent, count)
+
+
+@bp.route("/names")
+def names():
+    # Generate a batch of random names, optionally reproducible through a seed
+    if request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        return names_stream()
+
+    try:
+        count, seed = _parse_count_and_seed()
+    except ValueError:
+        return jsonify({"error": "count and seed must be integers"}), 400
+
+    if not 1 <= count <= names_max_count:
+        return jsonify({"error": f"count must be between 1 and {names_max_count}"}), 400
+
+    start = time.perf_counter()
+    random_names = generate_names(count, seed)
+    observe_generation_duration(time.perf_counter() - start, path="batch")
+    with _span(__name__):
+        logger.info("Random Names Generated: - %d", count)
+
+    return _render({"names": random_names})
+
+
+@bp.route("/names/stream")
+def names_stream():
+    # Stream a large batch of random names as newline-delimited JSON
+    try:
+        count, seed = _parse_count_and_seed()
+    except ValueError:
+        return jsonify({"error": "count and seed must be integers"}), 400
+
+    if not 1 <= count <= names_stream_max_count:
+        return jsonify({"error": f"count must be between 1 and {names_stream_max_count}"}), 400
+
+    with _span(__name__):
+        logger.info("Random Names Streamed: - %d", count)
+
+    return Response(_stream_names(count, seed), mimetype=NDJSON_MIMETYPE)
+
+
+@bp.route("/names/by-id/<key>")
+def name_by_id(key):
+    # Map an entity ID to the same name on every call
+    name = cached_name_for_id(key)
+    with _span(__name__):
+        logger.info("Name Mapped By ID: - %s", name)
+
+    return _render({"name": name})
+
+
+@bp.route("/names/by-id", methods=["POST"])
+def names_by_id():
+    # Map a JSON array of entity IDs to their names, in request order
+    try:
+        keys = _parse_keys(request.get_data())
+    except ValueError:
+        return jsonify({"error": "body must be a JSON object with an ids array of strings or integers"}), 400
+
+    if not 1 <= len(keys) <= names_by_id_max_count:
+        return jsonify({"error": f"ids must hold between 1 and {names_by_id_max_count} IDs"}), 400
+
+    start = time.perf_counter()
+    random_names = list(map(cached_name_for_id, keys))
+    observe_generation_duration(time.perf_counter() - start, path="by_id")
+    with _span(__name__):
+        logger.info("Names Mapped By ID: - %d", len(keys))
+
+    return _render({"names": random_names})
+
+
+def _parse_keys(data):
+    """
+    Parses the {"ids": [...]} body of a bulk names by ID request.
+
+    Returns:
+        list[str]: The IDs as strings. Raises ValueError if the body is not in the expected shape.
+    """
+    body = loads_json(data)
+    keys = body.get("ids") if isinstance(body, dict) else None
+
+    if not isinstance(keys, list) or not all(type(key) in (str, int) for key in keys):
+        raise ValueError("ids must be a list of strings or integers")
 
-    return jsonify(json)
+    return [key if type(key) is str else str(key) for key in keys]
@@ -0,0 +1,192 @@
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from . import admission, app as names, telemetry_exporter
+from .health import HEALTHY_BODY, readiness_checks
+from .metrics import PROMETHEUS_MIMETYPE, count_request, observe_request_duration, registry
+from .names import generate_names
+from .serializers import JSON_MIMETYPE, MIMETYPES, serialize
+
+# Probe and metrics requests are neither admission controlled nor counted in the request metrics
+UNMETERED_PATHS = frozenset(("/metrics", "/healthz", "/readyz"))
+
+
+def create_asgi_app():
+    """
+    Creates the async variant of the names service.
+
+    The routes and JSON contract mirror the Flask names blueprint, and the name pool and limits
+    are shared with it, so either app can be served from the same image.
+    """
+    fastapi = FastAPI()
+    controller = admission.from_env()
+    controller.register_metrics()
+    slots = asyncio.Semaphore(controller.max_in_flight)
+
+    @fastapi.middleware("http")
+    async def admit(request: Request, call_next):
+        if request.url.path in UNMETERED_PATHS:
+            return await call_next(request)
+
+        queued = admission.queued_seconds(request.headers.get(admission.REQUEST_START_HEADER)) or 0.0
+        try:
+            if queued >= controller.max_queue_wait:
+                raise asyncio.TimeoutError()
+            await asyncio.wait_for(slots.acquire(), controller.max_queue_wait - queued)
+        except asyncio.TimeoutError:
+            controller.shed += 1
+            request.state.admission_shed = True
+            return JSONResponse(
+                {"error": admission.OVERLOADED_MESSAGE},
+                status_code=503,
+                headers={"Retry-After": str(controller.retry_after)},
+            )
+
+        controller.in_flight += 1
+        try:
+            return await call_next(request)
+        finally:
+            controller.in_flight -= 1
+            slots.release()
+
+    @fastapi.middleware("http")
+    async def record_request_metrics(request: Request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+
+        if request.url.path not in UNMETERED_PATHS:
+            registry.ensure_started()
+            route = request.scope["route"].path if "route" in request.scope else request.url.path
+            count_request(route=route, method=request.method, status=response.status_code)
+            observe_request_duration(time.perf_counter() - start, route=route)
+
+        return response
+
+    @fastapi.get("/metrics")
+    def metrics():
+        # Expose the metrics of every worker in the Prometheus text format
+        return Response(registry.collect(), media_type=PROMETHEUS_MIMETYPE)
+
+    @fastapi.get("/healthz")
+    async def healthz():
+        return Response(HEALTHY_BODY, media_type="application/json")
+
+    @fastapi.get("/readyz")
+    async def readyz(request: Request):
+        checks = readiness_checks(telemetry_exporter(request.app))
+        ready = all(checks.values())
+
+        return JSONResponse(
+            {"status": "ready" if ready else "not ready", "checks": checks}, status_code=200 if ready else 503
+        )
+
+    @fastapi.get("/")
+    async def hello_world(request: Request):
+        # Pop a pre-generated random name including a first name and adjective
+        random_name = names.name_pool.pop()
+        names.logger.info("Random Name Selected: - %s", random_name)
+
+        return _render(request, {"name": random_name})
+
+    @fastapi.get("/names")
+    def batch_names(request: Request):
+        # Generate a batch of random names, optionally reproducible through a seed
+        if _accepts_ndjson(request):
+            return stream_names(request)
+
+        try:
+            count, seed = _parse_count_and_seed(request)
+        except ValueError:
+            return JSONResponse({"error": "count and seed must be integers"}, status_code=400)
+
+        if not 1 <= count <= names.names_max_count:
+            return JSONResponse(
+                {"error": f"count must be between 1 and {names.names_max_count}"}, status_code=400
+            )
+
+        random_names = generate_names(count, seed)
+        names.logger.info("Random Names Generated: - %d", count)
+
+        return _render(request, {"names": random_names})
+
+    @fastapi.get("/names/stream")
+    def stream_names(request: Request):
+        # Stream a large batch of random names as newline-delimited JSON
+        try:
+            count, seed = _parse_count_and_seed(request)
+        except ValueError:
+            return JSONResponse({"error": "count and seed must be integers"}, status_code=400)
+
+        if not 1 <= count <= names.names_stream_max_count:
+            return JSONResponse(
+                {"error": f"count must be between 1 and {names.names_stream_max_count}"}, status_code=400
+            )
+
+        names.logger.info("Random Names Streamed: - %d", count)
+
+        return StreamingResponse(names._stream_names(count, seed), media_type=names.NDJSON_MIMETYPE)
+
+    @fastapi.get("/names/by-id/{key}")
+    async def name_by_id(request: Request, key: str):
+        # Map an entity ID to the same name on every call
+        name = names.cached_name_for_id(key)
+        names.logger.info("Name Mapped By ID: - %s", name)
+
+        return _render(request, {"name": name})
+
+    @fastapi.post("/names/by-id")
+    async def names_by_id(request: Request):
+        # Map a JSON array of entity IDs to their names, in request order
+        try:
+            keys = names._parse_keys(await request.body())
+        except ValueError:
+            return JSONResponse(
+                {"error": "body must be a JSON object with an ids array of strings or integers"}, status_code=400
+            )
+
+        if not 1 <= len(keys) <= names.names_by_id_max_count:
+            return JSONResponse(
+                {"error": f"ids must hold between 1 and {names.names_by_id_max_count} IDs"}, status_code=400
+            )
+
+        random_names = list(map(names.cached_name_for_id, keys))
+        names.logger.info("Names Mapped By ID: - %d", len(keys))
+
+        return _render(request, {"names": random_names})
+
+    return fastapi
+
+
+def _parse_count_and_seed(request):
+    """
+    Parses the count and seed query arguments shared by the batch routes.
+
+    Returns:
+        A (count, seed) tuple. Raises ValueError if either argument is not an integer.
+    """
+    count = int(request.query_params.get("count", "1"))
+    seed = int(request.query_params["seed"]) if "seed" in request.query_params else None
+
+    return count, seed
+
+
+def _accepts_ndjson(request):
+    """
+    Returns True when the request's Accept header asks for newline-delimited JSON.
+    """
+    return request.headers.get("accept", "").split(";")[0].strip() == names.NDJSON_MIMETYPE
+
+
+def _render(request, body):
+    """
+    Serializes a name response body to the media type preferred by the request's Accept header.
+    """
+    accept = parse_accept_header(request.headers.get("accept"), MIMEAccept)
+    mimetype = accept.best_match(MIMETYPES, default=JSON_MIMETYPE)
+
+    return Response(serialize(body, mimetype), media_type=mimetype, headers={"Vary": "Accept"})
@@ -0,0 +1,37 @@
+from flask import Blueprint, Response, current_app, jsonify
+
+from . import app as names
+
+bp = Blueprint("health", __name__)
+HEALTHY_BODY = b'{"status": "ok"}\n'
+
+
+def readiness_checks(exporter=None):
+    """
+    Returns the warm-up state of the current worker process.
+
+    Args:
+        exporter (ProcessLocalExporter): The telemetry exporter, or None when telemetry is disabled.
+
+    Returns:
+        dict: The name of each check mapped to True once it passed.
+    """
+    return {
+        "name_pool": names.name_pool.ready,
+        "telemetry_exporter": exporter is None or exporter.running,
+    }
+
+
+@bp.route("/healthz")
+def healthz():
+    # Liveness only proves the worker serves requests, so it skips tracing, logging and metrics
+    return Response(HEALTHY_BODY, mimetype="application/json")
+
+
+@bp.route("/readyz")
+def readyz():
+    # Readiness holds traffic back until the worker has been warmed up
+    checks = readiness_checks(current_app.extensions.get("telemetry_exporter"))
+    status = 200 if all(checks.values()) else 503
+
+    return jsonify({"status": "ready" if status == 200 else "not ready", "checks": checks}), status
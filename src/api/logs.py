@@ -0,0 +1,129 @@
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+
+class _DroppingQueueListener(QueueListener):
+    """
+    A QueueListener whose stop() never fails on a full queue.
+    """
+
+    dropped = 0
+
+    def enqueue_sentinel(self):
+        # stop() puts the sentinel with put_nowait, which raises queue.Full when the queue is full
+        # at shutdown. The oldest record is dropped to make room, like records logged while the
+        # queue is full.
+        while True:
+            try:
+                self.queue.put_nowait(self._sentinel)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    A logging handler that hands records to a per-process listener thread.
+
+    Records are put on a bounded queue without being formatted, and the listener thread formats
+    and writes them through the wrapped handler. When the queue is full the record is dropped and
+    counted, so a slow log collector never stalls the request thread.
+    """
+
+    def __init__(self, handler, capacity=10000):
+        """
+        Initializes a new instance of the DroppingQueueHandler class.
+
+        Args:
+            handler (logging.Handler): The handler that formats and writes records.
+            capacity (int): The maximum number of records waiting to be written.
+        """
+        super().__init__(queue.Queue(maxsize=capacity))
+        self.handler = handler
+        self.capacity = capacity
+        self.dropped = 0
+        self._listener = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def enqueue(self, record):
+        self.ensure_started()
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Records never leave the process, so formatting is left to the listener thread
+        return record
+
+    def close(self):
+        """
+        Stops the listener thread after it has written every queued record.
+        """
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+                self.dropped += self._listener.dropped
+            self._listener = None
+            self._pid = None
+
+        super().close()
+
+    def ensure_started(self):
+        """
+        Starts the listener thread once per process.
+
+        Threads and their locks do not survive a fork, so a forked gunicorn worker gets a fresh
+        queue and listener.
+        """
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            self.queue = queue.Queue(maxsize=self.capacity)
+            self._listener = _DroppingQueueListener(self.queue, self.handler, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+
+def configure_logging(log_format, defaults=None):
+    """
+    Configures the root logger for the API.
+
+    LOG_MODE=queue (the default) writes records from a listener thread through a
+    DroppingQueueHandler bounded by LOG_QUEUE_CAPACITY, while LOG_MODE=sync writes them on the
+    calling thread.
+
+    Args:
+        log_format (str): The format used for every log record.
+        defaults (dict): Values for format fields missing from a record, such as the trace
+            fields of records logged outside a traced request.
+
+    Returns:
+        The installed DroppingQueueHandler in queue mode, otherwise None.
+    """
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(log_format, defaults=defaults))
+
+    if os.getenv("LOG_MODE", "queue") != "queue":
+        logging.basicConfig(handlers=[stream_handler])
+        return None
+
+    handler = DroppingQueueHandler(stream_handler, capacity=int(os.getenv("LOG_QUEUE_CAPACITY", "10000")))
+    logging.basicConfig(handlers=[handler])
+
+    # basicConfig does nothing when the root logger was already configured by the host process
+    return handler if handler in logging.getLogger().handlers else None
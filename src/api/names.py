@@ -0,0 +1,108 @@
+import hashlib
+import os
+import random
+
+from randomname.util import get_groups_list
+
+# Word lists are loaded once per process into compact tuples, matching the categories and
+# separator used by randomname.generate().
+ADJECTIVES = tuple(word.replace(" ", "-") for word in get_groups_list("adj/"))
+NOUNS = tuple(word.replace(" ", "-") for word in get_groups_list("n/"))
+# Words listed in several categories are kept once in the numbered name space, so every index
+# spells a distinct name. The lists above stay as they are, since name_for_id indexes into them.
+DISTINCT_ADJECTIVES = tuple(dict.fromkeys(ADJECTIVES))
+DISTINCT_NOUNS = tuple(dict.fromkeys(NOUNS))
+# Every distinct adjective-noun pair is numbered, so a name can be addressed by a single index
+NAME_SPACE = len(DISTINCT_ADJECTIVES) * len(DISTINCT_NOUNS)
+
+_rng = random.Random()
+# A forked gunicorn worker inherits the RNG state of the master that preloaded the app, so every
+# worker would draw the same sequence of names. Each child reseeds from os.urandom instead.
+os.register_at_fork(after_in_child=_rng.seed)
+
+
+def generate_name():
+    """
+    Returns a single random adjective-noun name drawn from the preloaded word arrays.
+    """
+    return f"{_rng.choice(ADJECTIVES)}-{_rng.choice(NOUNS)}"
+
+
+def generate_names(count, seed=None):
+    """
+    Returns a batch of random adjective-noun names.
+
+    All adjective and noun indexes are drawn with one batched RNG call per word array instead
+    of composing every name through randomname.generate().
+
+    Args:
+        count (int): The number of names to generate.
+        seed (int): An optional seed that makes the batch reproducible.
+
+    Returns:
+        list[str]: The generated names.
+    """
+    return _draw_names(_rng if seed is None else random.Random(seed), count)
+
+
+def iter_name_chunks(count, chunk_size, seed=None):
+    """
+    Yields a large number of random names as a sequence of fixed-size batches.
+
+    Only one batch is held in memory at a time, so the memory used by a consumer stays constant
+    regardless of the total count.
+
+    Args:
+        count (int): The total number of names to generate.
+        chunk_size (int): The maximum number of names per batch.
+        seed (int): An optional seed that makes the whole sequence reproducible.
+
+    Yields:
+        list[str]: The next batch of generated names.
+    """
+    rng = _rng if seed is None else random.Random(seed)
+    remaining = count
+
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        remaining -= size
+        yield _draw_names(rng, size)
+
+
+def name_for_id(key):
+    """
+    Returns the adjective-noun name a key always maps to.
+
+    The key is hashed with BLAKE2b and the digest picks an index into each word array, so any key
+    is mapped in constant time without sequential RNG state. Names stay stable across processes
+    and releases as long as the word lists don't change.
+
+    Args:
+        key (str): The entity ID to name.
+
+    Returns:
+        str: The name of the key.
+    """
+    digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+    adjective, noun = divmod(digest % (len(ADJECTIVES) * len(NOUNS)), len(NOUNS))
+
+    return f"{ADJECTIVES[adjective]}-{NOUNS[noun]}"
+
+
+def name_at(index):
+    """
+    Returns the name numbered index, between 0 and NAME_SPACE - 1.
+    """
+    adjective, noun = divmod(index, len(DISTINCT_NOUNS))
+
+    return f"{DISTINCT_ADJECTIVES[adjective]}-{DISTINCT_NOUNS[noun]}"
+
+
+def _draw_names(rng, count):
+    """
+    Draws count adjective and noun indexes with one batched call per word array.
+    """
+    adjectives = rng.choices(ADJECTIVES, k=count)
+    nouns = rng.choices(NOUNS, k=count)
+
+    return list(map("-".join, zip(adjectives, nouns)))
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from collections import deque
+
+import randomname
+
+
+class NamePool:
+    """
+    An in-process ring buffer of pre-generated names.
+
+    Names are popped from the buffer on the request thread, while a background thread tops the
+    buffer back up once it drops below the low-water mark. If the buffer runs dry the name is
+    generated inline so a request is never blocked on the refill thread.
+    """
+
+    def __init__(self, size=1024, refill_batch=256, low_water=None, generator=randomname.generate,
+                 refill_observer=None):
+        """
+        Initializes a new instance of the NamePool class.
+
+        Args:
+            size (int): The maximum number of names held in the pool.
+            refill_batch (int): The number of names generated per refill step.
+            low_water (int): The pool length below which a refill is triggered.
+                Defaults to half of the pool size.
+            generator (callable): Returns a single freshly generated name.
+            refill_observer (callable): Called with the duration in seconds of every refill step.
+        """
+        if size < 1:
+            raise ValueError("size must be greater than 0")
+
+        if refill_batch < 1:
+            raise ValueError("refill_batch must be greater than 0")
+
+        self.size = size
+        self.refill_batch = min(refill_batch, size)
+        self.low_water = size // 2 if low_water is None else min(low_water, size)
+        self.generator = generator
+        self.refill_observer = refill_observer
+        self.misses = 0
+        self._names = deque(maxlen=size)
+        self._refill_needed = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._filled_pid = None
+        self._names_pid = None
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def ready(self):
+        """
+        True once the refill thread runs in this process and the pool has been filled at least once.
+        """
+        return self._pid == self._filled_pid == os.getpid()
+
+    def pop(self):
+        """
+        Returns a name from the pool, falling back to inline generation when the pool is empty.
+
+        Returns:
+            str: A randomly generated name.
+        """
+        self.ensure_started()
+
+        try:
+            name = self._names.popleft()
+        except IndexError:
+            self.misses += 1
+            name = self.generator()
+
+        if len(self._names) < self.low_water:
+            self._refill_needed.set()
+
+        return name
+
+    def fill(self):
+        """
+        Synchronously tops the pool up to its full size.
+        """
+        self._discard_inherited_names()
+
+        while len(self._names) < self.size:
+            self._refill()
+
+        self._filled_pid = os.getpid()
+
+    def _refill(self):
+        """
+        Appends up to one refill batch of names to the pool without exceeding its size.
+        """
+        start = time.perf_counter()
+        missing = min(self.refill_batch, self.size - len(self._names))
+        self._names.extend(self.generator() for _ in range(missing))
+        self._names_pid = os.getpid()
+
+        if self.refill_observer is not None:
+            self.refill_observer(time.perf_counter() - start)
+
+    def ensure_started(self):
+        """
+        Starts the refill thread once per process.
+
+        Threads do not survive a fork, so the pool tracks the pid that owns the running thread and
+        restarts it in a forked gunicorn worker.
+        """
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            self._discard_inherited_names()
+            self._refill_needed.set()
+            thread = threading.Thread(target=self._run, name="name-pool-refill", daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def _discard_inherited_names(self):
+        """
+        Empties a pool filled before a fork, since every forked worker inherits the same names.
+        """
+        if self._names_pid not in (None, os.getpid()):
+            self._names.clear()
+            self._names_pid = None
+
+    def _run(self):
+        """
+        Refills the pool whenever a pop drops it below the low-water mark.
+        """
+        while True:
+            self._refill_needed.wait()
+            self._refill_needed.clear()
+            self.fill()
@@ -0,0 +1,72 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is listed in requirements.txt
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+TEXT_MIMETYPE = "text/plain"
+
+
+def dumps_json(body):
+    """
+    Serializes a response body to JSON bytes, through orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(body)
+
+    return json.dumps(body, separators=(",", ":")).encode()
+
+
+def loads_json(data):
+    """
+    Parses a JSON request body, through orjson when it is installed. Raises ValueError if the body
+    is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+def _dumps_text(body):
+    """
+    Serializes a name response body to newline-delimited names.
+    """
+    (value,) = body.values()
+    if isinstance(value, str):
+        return f"{value}\n".encode()
+
+    return ("\n".join(value) + "\n").encode()
+
+
+SERIALIZERS = {
+    JSON_MIMETYPE: dumps_json,
+    TEXT_MIMETYPE: _dumps_text,
+}
+if msgpack is not None:
+    SERIALIZERS[MSGPACK_MIMETYPE] = msgpack.packb
+
+# JSON comes first, so it is chosen for */* and when no Accept header is sent
+MIMETYPES = tuple(SERIALIZERS)
+
+
+def serialize(body, mimetype=JSON_MIMETYPE):
+    """
+    Serializes a name response body to the given media type.
+
+    Args:
+        body (dict): Either {"name": str} or {"names": list[str]}.
+        mimetype (str): One of MIMETYPES.
+
+    Returns:
+        bytes: The encoded response body.
+    """
+    return SERIALIZERS[mimetype](body)
@@ -0,0 +1,322 @@
+import os
+import queue
+import threading
+import time
+
+from flask import g, request
+from opencensus.common import utils
+from opencensus.trace import execution_context, tracer as tracer_module
+from opencensus.trace.utils import disable_tracing_url
+from opencensus.trace.attributes_helper import COMMON_ATTRIBUTES
+from opencensus.trace.base_exporter import Exporter
+from opencensus.trace.propagation.trace_context_http_header_format import TraceContextPropagator
+from opencensus.trace.samplers import AlwaysOffSampler, AlwaysOnSampler, ProbabilitySampler, Sampler
+from opencensus.trace.span import SpanKind
+from opencensus.trace.span_context import SpanContext, generate_span_id
+from opencensus.trace.span_data import SpanData
+from opencensus.trace.trace_options import TraceOptions
+
+
+class RateLimitedSampler(Sampler):
+    """
+    Samples at most a fixed number of traces per second in the current worker process.
+
+    Traces already sampled upstream, for example by the Istio ingress gateway, are always kept.
+    """
+
+    def __init__(self, traces_per_second):
+        """
+        Initializes a new instance of the RateLimitedSampler class.
+
+        Args:
+            traces_per_second (float): The number of traces sampled per second per worker.
+        """
+        if traces_per_second < 0:
+            raise ValueError("traces_per_second cannot be negative")
+
+        self.traces_per_second = traces_per_second
+        self._burst = max(traces_per_second, 1.0) if traces_per_second > 0 else 0.0
+        self._tokens = self._burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def should_sample(self, span_context):
+        if span_context.trace_options.get_enabled():
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self.traces_per_second)
+            self._updated = now
+
+            if self._tokens < 1:
+                return False
+
+            self._tokens -= 1
+            return True
+
+
+class ProcessLocalExporter(Exporter):
+    """
+    Creates the wrapped exporter once per process and hands it the spans of that process.
+
+    AzureExporter already batches spans on a bounded queue drained by its own worker thread, and
+    retries failed batches from local storage. That thread is started when the exporter is
+    created, so an exporter created by a gunicorn master preloading the app would have no thread
+    in the forked workers and their spans would never be sent. This wrapper only defers creating
+    the exporter to the worker that uses it; batching, export and retries are left to the SDK.
+
+    Spans are put on the SDK queue without blocking. When it is full they are dropped and counted,
+    without the SDK's warning per dropped span, so a slow Application Insights endpoint never
+    blocks a request or floods the logs.
+    """
+
+    def __init__(self, factory, capacity=8192, max_batch_size=100, export_interval=5.0):
+        """
+        Initializes a new instance of the ProcessLocalExporter class.
+
+        Args:
+            factory (callable): Creates the exporter from the queue_capacity, max_batch_size and
+                export_interval options, such as AzureExporter with its connection string bound.
+            capacity (int): The maximum number of spans waiting to be exported.
+            max_batch_size (int): The maximum number of spans per batch.
+            export_interval (float): The maximum number of seconds a span waits for its batch.
+        """
+        self.factory = factory
+        self.capacity = capacity
+        self.max_batch_size = max_batch_size
+        self.export_interval = export_interval
+        self.dropped = 0
+        self.exporter = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def __len__(self):
+        return self._queue().qsize() if self.running else 0
+
+    @property
+    def running(self):
+        """
+        True when the exporter of this process has been created and its worker thread runs.
+        """
+        return self._pid == os.getpid() and self.exporter._worker.is_alive()
+
+    def export(self, span_datas):
+        self.ensure_started()
+        spans = self._queue()
+
+        for span_data in span_datas:
+            try:
+                spans.put_nowait(span_data)
+            except queue.Full:
+                self.dropped += 1
+
+    def emit(self, span_datas):
+        self.export(span_datas)
+
+    def _queue(self):
+        # The queue.Queue inside the SDK's opencensus.common.schedule.Queue
+        return self.exporter._queue._queue
+
+    def ensure_started(self):
+        """
+        Creates the exporter, and with it the SDK's export thread, once per process, including in
+        forked gunicorn workers.
+        """
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            self.exporter = self.factory(
+                queue_capacity=self.capacity,
+                max_batch_size=self.max_batch_size,
+                export_interval=self.export_interval,
+            )
+            self._pid = os.getpid()
+
+
+def build_sampler():
+    """
+    Builds the request sampler selected by the TRACE_SAMPLER environment variable.
+
+    Supported values are "probability" (TRACE_SAMPLING_RATE, defaults to 1.0), "rate_limited"
+    (TRACE_SAMPLES_PER_SECOND per worker, defaults to 10), "always_on" and "always_off".
+    """
+    sampler = os.getenv("TRACE_SAMPLER", "probability")
+
+    if sampler == "probability":
+        return ProbabilitySampler(rate=float(os.getenv("TRACE_SAMPLING_RATE", "1.0")))
+    if sampler == "rate_limited":
+        return RateLimitedSampler(float(os.getenv("TRACE_SAMPLES_PER_SECOND", "10")))
+    if sampler == "always_on":
+        return AlwaysOnSampler()
+    if sampler == "always_off":
+        return AlwaysOffSampler()
+
+    raise ValueError(f"Unknown TRACE_SAMPLER {sampler}.")
+
+
+def build_exporter(factory):
+    """
+    Builds a ProcessLocalExporter configured from the TELEMETRY_* environment variables.
+    """
+    return ProcessLocalExporter(
+        factory,
+        capacity=int(os.getenv("TELEMETRY_QUEUE_CAPACITY", "8192")),
+        max_batch_size=int(os.getenv("TELEMETRY_MAX_BATCH_SIZE", "100")),
+        export_interval=float(os.getenv("TELEMETRY_EXPORT_INTERVAL", "5.0")),
+    )
+
+
+def build_excludelist_paths():
+    """
+    Returns the request paths that are never traced, from the TRACE_EXCLUDED_PATHS environment
+    variable.
+
+    The value is a comma-separated list of path prefixes and defaults to the probe and metrics
+    routes. opencensus matches prefixes against the path without its leading slash.
+    """
+    paths = os.getenv("TRACE_EXCLUDED_PATHS", "/healthz,/readyz,/metrics").split(",")
+
+    return [path.strip().lstrip("/") for path in paths if path.strip()]
+
+
+def register_error_sampling(flask, exporter, excludelist_paths=()):
+    """
+    Exports a server span for every failed request that the sampler chose not to trace.
+
+    Requests shed by admission control are skipped, so error export does not grow with overload.
+
+    Args:
+        flask (Flask): The Flask app whose requests are traced.
+        exporter (Exporter): The exporter the error spans are sent to.
+        excludelist_paths (list[str]): The path prefixes that are never traced.
+    """
+
+    @flask.before_request
+    def _record_request_start():
+        if not disable_tracing_url(request.url, list(excludelist_paths)):
+            g.telemetry_start_time = utils.to_iso_str()
+
+    @flask.after_request
+    def _sample_error(response):
+        if response.status_code < 500 or "telemetry_start_time" not in g or g.get("admission_shed"):
+            return response
+
+        span_context = getattr(execution_context.get_opencensus_tracer(), "span_context", None)
+        if span_context is not None and span_context.trace_options.get_enabled():
+            return response
+
+        attributes = _request_attributes(request.host, request.method, request.path, str(request.url))
+        attributes[COMMON_ATTRIBUTES["HTTP_STATUS_CODE"]] = response.status_code
+        if request.url_rule is not None:
+            attributes[COMMON_ATTRIBUTES["HTTP_ROUTE"]] = request.url_rule.rule
+        exporter.export([_error_span_data(
+            span_context, f"[{request.method}]{request.url}", attributes, g.telemetry_start_time
+        )])
+
+        return response
+
+
+def register_asgi_tracing(fastapi, exporter, sampler, excludelist_paths=(), errors_always_sampled=True):
+    """
+    Traces the requests of a FastAPI app the way FlaskMiddleware and register_error_sampling trace
+    the Flask app.
+
+    Each request gets a server span continued from its traceparent header, which is the current
+    span while the route runs, so its log records carry the trace and span IDs. Failed requests
+    the sampler skipped are exported when errors_always_sampled is set, except requests shed by
+    admission control. The span of a streamed response ends when the response starts.
+
+    Args:
+        fastapi (FastAPI): The FastAPI app whose requests are traced.
+        exporter (Exporter): The exporter the spans are sent to.
+        sampler (Sampler): The request sampler.
+        excludelist_paths (list[str]): The path prefixes that are never traced.
+        errors_always_sampled (bool): Whether failed requests are exported when not sampled.
+    """
+    propagator = TraceContextPropagator()
+
+    @fastapi.middleware("http")
+    async def trace_request(request, call_next):
+        url = str(request.url)
+        if disable_tracing_url(url, list(excludelist_paths)):
+            return await call_next(request)
+
+        start_time = utils.to_iso_str()
+        tracer = tracer_module.Tracer(
+            span_context=propagator.from_headers(request.headers),
+            sampler=sampler,
+            exporter=exporter,
+            propagator=propagator,
+        )
+        name = f"[{request.method}]{url}"
+        span = tracer.start_span(name=name)
+        span.span_kind = SpanKind.SERVER
+        attributes = _request_attributes(request.headers.get("host", ""), request.method, request.url.path, url)
+        for key, value in attributes.items():
+            tracer.add_attribute_to_current_span(key, value)
+
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+        finally:
+            attributes[COMMON_ATTRIBUTES["HTTP_STATUS_CODE"]] = status_code
+            tracer.add_attribute_to_current_span(COMMON_ATTRIBUTES["HTTP_STATUS_CODE"], status_code)
+            if "route" in request.scope:
+                attributes[COMMON_ATTRIBUTES["HTTP_ROUTE"]] = request.scope["route"].path
+                tracer.add_attribute_to_current_span(COMMON_ATTRIBUTES["HTTP_ROUTE"], request.scope["route"].path)
+            tracer.end_span()
+            tracer.finish()
+
+            sampled = tracer.span_context.trace_options.get_enabled()
+            shed = getattr(request.state, "admission_shed", False)
+            if errors_always_sampled and status_code >= 500 and not sampled and not shed:
+                exporter.export([_error_span_data(tracer.span_context, name, attributes, start_time)])
+
+        return response
+
+
+def _request_attributes(host, method, path, url):
+    """
+    Returns the span attributes FlaskMiddleware records for a request.
+    """
+    return {
+        COMMON_ATTRIBUTES["HTTP_HOST"]: host,
+        COMMON_ATTRIBUTES["HTTP_METHOD"]: method,
+        COMMON_ATTRIBUTES["HTTP_PATH"]: path,
+        COMMON_ATTRIBUTES["HTTP_URL"]: url,
+    }
+
+
+def _error_span_data(span_context, name, attributes, start_time):
+    """
+    Builds the span data for a failed request that was not sampled.
+    """
+    context = SpanContext(
+        trace_id=span_context.trace_id if span_context is not None else None,
+        trace_options=TraceOptions("1"),
+        from_header=False,
+    )
+
+    return SpanData(
+        name=name,
+        context=context,
+        span_id=generate_span_id(),
+        parent_span_id=span_context.span_id if span_context is not None else None,
+        attributes=attributes,
+        start_time=start_time,
+        end_time=utils.to_iso_str(),
+        child_span_count=0,
+        stack_trace=None,
+        annotations=[],
+        message_events=[],
+        links=[],
+        status=None,
+        same_process_as_parent_span=None,
+        span_kind=SpanKind.SERVER,
+    )
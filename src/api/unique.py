@@ -0,0 +1,155 @@
+import fcntl
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from .names import NAME_SPACE, name_at
+
+# generation (uint64), names marked in the current generation (uint64), generation start (double)
+HEADER = struct.Struct("=QQd")
+HEADER_SIZE = 64
+COUNT = struct.Struct("=Q")
+COUNT_OFFSET = 8
+
+
+class SharedNameFilter:
+    """
+    Draws names that were not handed out by any worker within a sliding window.
+
+    Every adjective-noun pair has its own byte in each of two generations of a memory-mapped
+    table, so the filter is exact and its size is fixed at two bytes per possible name. When path
+    is set, every gunicorn worker maps the same file and sees the names drawn by the others. A name
+    is taken while it is marked in either generation. Once the current generation has marked
+    window_count names or is window_seconds old, the older one is cleared and becomes current, so
+    a name can only repeat after at least one full window has passed.
+
+    Marks are single byte stores without a lock, so two workers drawing the same name in the same
+    instant can both hand it out. The lock is only taken to rotate generations.
+    """
+
+    def __init__(self, path=None, window_count=100000, window_seconds=3600.0, max_redraws=32):
+        """
+        Initializes a new instance of the SharedNameFilter class.
+
+        Args:
+            path (str): The file shared by all worker processes, or None to only filter names
+                drawn by the current process.
+            window_count (int): The number of names per generation.
+            window_seconds (float): The maximum age in seconds of the current generation.
+            max_redraws (int): The number of taken names drawn before one is handed out anyway.
+        """
+        if not 0 < window_count <= NAME_SPACE // 4:
+            raise ValueError(f"window_count must be between 1 and {NAME_SPACE // 4}")
+
+        self.window_count = window_count
+        self.window_seconds = window_seconds
+        self.max_redraws = max_redraws
+        self.drawn = 0
+        self.redraws = 0
+        self._rng = random.Random()
+        self._rng_pid = os.getpid()
+        self._lock = threading.Lock()
+        self._fd = None
+        size = HEADER_SIZE + 2 * NAME_SPACE
+
+        if path is None:
+            self._map = mmap.mmap(-1, size)
+        else:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+
+        with self._rotation_lock():
+            if HEADER.unpack_from(self._map, 0)[2] == 0:
+                HEADER.pack_into(self._map, 0, 0, 0, time.time())
+
+    def draw(self):
+        """
+        Returns a random name that was not drawn within the window, and marks it as taken.
+
+        Returns:
+            str: A randomly generated name.
+        """
+        if self._rng_pid != os.getpid():
+            # A worker forked from a preloading master inherits the RNG state, so every worker
+            # would draw the same indexes and collide on each other's marks
+            self._rng.seed()
+            self._rng_pid = os.getpid()
+
+        generation, count, started = HEADER.unpack_from(self._map, 0)
+        if count >= self.window_count or time.time() - started >= self.window_seconds:
+            generation = self._rotate(generation)
+
+        current = HEADER_SIZE + (generation % 2) * NAME_SPACE
+        previous = HEADER_SIZE + (1 - generation % 2) * NAME_SPACE
+        table = self._map
+        self.drawn += 1
+
+        for _ in range(self.max_redraws):
+            index = self._rng.randrange(NAME_SPACE)
+            if not table[current + index] and not table[previous + index]:
+                break
+            self.redraws += 1
+
+        table[current + index] = 1
+        COUNT.pack_into(table, COUNT_OFFSET, COUNT.unpack_from(table, COUNT_OFFSET)[0] + 1)
+
+        return name_at(index)
+
+    def _rotate(self, generation):
+        """
+        Clears the older generation and makes it current, unless another worker already did.
+
+        Returns:
+            int: The current generation.
+        """
+        with self._rotation_lock():
+            current, count, started = HEADER.unpack_from(self._map, 0)
+            expired = count >= self.window_count or time.time() - started >= self.window_seconds
+            if current != generation or not expired:
+                return current
+
+            offset = HEADER_SIZE + ((current + 1) % 2) * NAME_SPACE
+            self._map[offset:offset + NAME_SPACE] = bytes(NAME_SPACE)
+            HEADER.pack_into(self._map, 0, current + 1, 0, time.time())
+
+            return current + 1
+
+    @contextmanager
+    def _rotation_lock(self):
+        """
+        Holds the thread lock and, when the filter is backed by a file, a POSIX lock on it.
+
+        POSIX record locks belong to the process rather than to the file description, so they also
+        exclude workers that inherited the file from a preloading gunicorn master.
+        """
+        with self._lock:
+            if self._fd is None:
+                yield
+                return
+
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+
+def from_env():
+    """
+    Creates a SharedNameFilter configured from the UNIQUE_NAMES_* environment variables, or returns
+    None when UNIQUE_NAMES is not enabled.
+    """
+    if os.getenv("UNIQUE_NAMES", "false").lower() != "true":
+        return None
+
+    return SharedNameFilter(
+        path=os.getenv("UNIQUE_NAMES_FILE"),
+        window_count=int(os.getenv("UNIQUE_NAMES_WINDOW_COUNT", "100000")),
+        window_seconds=float(os.getenv("UNIQUE_NAMES_WINDOW_SECONDS", "3600")),
+    )
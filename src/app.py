@@ -1,3 +1,7 @@
-from api import create_app
+import os
 
-app = create_app()
\ No newline at end of file
+from api import create_app, create_asgi_app
+
+# SERVER_MODE selects the Flask (wsgi) or FastAPI (asgi) variant of the names service and must
+# match the gunicorn worker class picked in gunicorn.conf.py.
+app = create_asgi_app() if os.getenv("SERVER_MODE", "wsgi") == "asgi" else create_app()
\ No newline at end of file
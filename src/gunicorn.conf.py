@@ -1,4 +1,96 @@
+import gc
+import math
+import os
+import shutil
+import tempfile
+
+
+def cpu_limit():
+    """
+    Returns the number of CPUs available to the container.
+
+    The cgroup CPU quota (v2, then v1) takes precedence over the CPU affinity of the process,
+    because a pod limited to 2 CPUs still sees every CPU of its node.
+    """
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "r", encoding="utf-8") as r_stream:
+            quota, period = r_stream.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r", encoding="utf-8") as r_stream:
+            quota = int(r_stream.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r", encoding="utf-8") as r_stream:
+            period = int(r_stream.read())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+# The temporary directories created here, removed again when the master exits
+temporary_dirs = []
+
+
+def make_temporary_dir(prefix, parent=None):
+    path = tempfile.mkdtemp(prefix=prefix, dir=parent)
+    temporary_dirs.append(path)
+    return path
+
+
+# Every worker writes its metrics snapshot to this directory so /metrics reports the whole pod
+if "METRICS_DIR" not in os.environ:
+    os.environ["METRICS_DIR"] = make_temporary_dir("names-metrics-")
+# With UNIQUE_NAMES enabled, every worker maps this file to share the names handed out. /dev/shm
+# keeps it in memory rather than writing its pages back to the container's disk.
+if os.getenv("UNIQUE_NAMES", "false").lower() == "true" and "UNIQUE_NAMES_FILE" not in os.environ:
+    os.environ["UNIQUE_NAMES_FILE"] = os.path.join(
+        make_temporary_dir("names-unique-", "/dev/shm" if os.path.isdir("/dev/shm") else None), "filter"
+    )
+
+cpus = cpu_limit()
+server_mode = os.getenv("SERVER_MODE", "wsgi")
+
 bind = "[::]:5000"
-workers = 4
-threads = 4
-timeout = 120
\ No newline at end of file
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true"
+
+# SERVER_MODE=asgi serves the FastAPI variant of the app on uvicorn workers, so connection
+# concurrency is no longer capped by the gthread pool size and one worker per CPU is enough.
+if server_mode == "asgi":
+    worker_class = "uvicorn.workers.UvicornWorker"
+    workers = int(os.getenv("GUNICORN_WORKERS", str(cpus)))
+else:
+    worker_class = "gthread"
+    workers = int(os.getenv("GUNICORN_WORKERS", str(2 * cpus + 1)))
+    # A fixed thread count is intended: the worker count already follows the CPU quota, so total
+    # concurrency (workers x threads) scales with it. Within a worker the GIL runs one thread at a
+    # time, so threads only cover I/O waits such as telemetry export, which don't grow with CPUs.
+    threads = int(os.getenv("GUNICORN_THREADS", "4"))
+    # A worker never runs more requests than it has threads, so admission control gets one slot
+    # per thread. Overload then shows up as queue wait measured from X-Request-Start.
+    os.environ.setdefault("ADMISSION_MAX_IN_FLIGHT", str(threads))
+
+
+def when_ready(_):
+    # With preload_app the master has imported Flask, opencensus and the word lists. Moving them
+    # out of the garbage collector's generations keeps forked workers from dirtying those pages.
+    if preload_app:
+        gc.freeze()
+
+
+def on_exit(_):
+    for path in temporary_dirs:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def post_worker_init(worker):
+    # Runs in each worker once the app is loaded, so its first request isn't a cold one
+    from api import warm_up
+
+    warm_up(worker.wsgi)
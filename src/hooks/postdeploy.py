@@ -1,26 +1,24 @@
+import argparse
 import os
-import subprocess
 import tempfile
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 import yaml
 from wrappers.github import GitClient
-from wrappers.azure import AzureClient
-from wrappers.renderer import RenderEngine
+from wrappers.azd import AzdEnvironment, environment_dir
+from wrappers.azure import AzureClient, refresh_requested
+from wrappers.renderer import RenderEngine, add_services_to_kustomization
 
 TEMPLATE_FILE = "azure.yaml"
 CWD = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
 
 def set_env_from_azd():
     """
-    Sets environment variables from the values returned by the 'azd env get-values' command.
-    """
-    env_string = subprocess.check_output(["azd", "env", "get-values", "--cwd", CWD], \
-        universal_newlines=True)
+    Sets environment variables from the values of the active azd environment.
 
-    for env_var in env_string.splitlines():
-        env_var = env_var.replace("'", "").replace('"', "")
-        key, value = env_var.split("=")
-        os.environ[key] = value
+    The environment's .env file is read directly, falling back to 'azd env get-values' when the
+    environment directory cannot be found.
+    """
+    os.environ.update(AzdEnvironment(environment_dir(CWD), CWD).values())
 
 def get_services_to_deploy(yaml_template) -> dict:
     """
@@ -69,9 +67,12 @@ def pre_req_assertions(deployment_template):
     os.environ['SERVICE_API_IMAGE_REPO'] = os.environ['SERVICE_API_IMAGE_NAME'].split(':')[0]
     os.environ['SERVICE_API_IMAGE_TAG'] = os.environ['SERVICE_API_IMAGE_NAME'].split(':')[1]
 
-def set_gh_pat_token():
+def set_gh_pat_token(refresh=False):
     """
     Gets the GitHub PAT token from the environment variables.
+
+    Args:
+        refresh (bool): Ignores cached Azure discovery results.
     """
     if os.environ.get("AZURE_AKS_ENVIRONMENT_NAME") is None:
         raise ValueError(
@@ -79,11 +80,12 @@ def set_gh_pat_token():
                 "
         )
 
-    azure_client = AzureClient()
+    azure_client = AzureClient(environment_dir(CWD), refresh)
     bb_keyvault = azure_client.get_keyvault(
         os.environ.get("AZURE_AKS_ENVIRONMENT_NAME"), 
         os.environ.get("AZURE_SUBSCRIPTION_ID"), 
-        os.environ.get("AZURE_RESOURCE_GROUP")
+        os.environ.get("AZURE_RESOURCE_GROUP"),
+        keyvault_name=os.environ.get("AZURE_KEY_VAULT_NAME")
     )
 
     if bb_keyvault is None:
@@ -96,27 +98,96 @@ def set_gh_pat_token():
     if pat_token is not None:
         azure_client.set_azd_env_variable("GITHUB_TOKEN", pat_token, True)
 
-def copy_manifest_dir_tree_to_repo(manifest_path, repo_path):
+def render_manifest_path(service):
+    """
+    Returns the render manifest of a service, kept in the azd environment directory rather than
+    in the GitOps repo, so it is never pushed next to the Kubernetes manifests.
+    """
+    env_dir = environment_dir(CWD) or os.path.join(CWD, ".azure")
+
+    return os.path.join(env_dir, "render-manifests", f"{service}.json")
+
+def render_service(service, service_config, gitops_environment_path, dry_run=False):
+    """
+    Renders the manifests of a service into the GitOps repo.
+
+    The service is rendered with its own copy of the environment variables, with SERVICE_NAME set
+    to the service, so services can be rendered concurrently.
+
+    Returns:
+        list[str]: The manifests that changed.
+    """
+    print(f"Deploying service: {service}")
+    if "project" not in service_config:
+        raise ValueError(
+            f"Project directory path not found for service: {service}. \
+                Please add a project property to the service in the yaml file."
+        )
+
+    project_dir = service_config["project"]
+    manifest_dir = "manifests"
+
+    if "k8s" in service_config \
+        and "deploymentPath" in service_config["k8s"]:
+        manifest_dir = service_config["k8s"]["deploymentPath"]
+
+    manifest_path = os.path.join(CWD, project_dir, manifest_dir)
+    service_render_path = os.path.join(gitops_environment_path, "services", service)
+    render_client = RenderEngine(manifest_path, \
+                                 os.path.join(gitops_environment_path, \
+                                    "kustomization.yaml"), \
+                                    service, \
+                                    strict=os.environ.get("RENDER_STRICT", "false").lower() == "true", \
+                                    dry_run=dry_run, \
+                                    output_path=service_render_path, \
+                                    variables=dict(os.environ, SERVICE_NAME=service), \
+                                    manifest_path=render_manifest_path(service))
+    changed = render_client.render(update_kustomization=False)
+
+    if dry_run:
+        print(f"Dry run: {len(changed)} manifests of service {service} would change.")
+
+    return changed
+
+def render_services(services_to_deploy, gitops_environment_path, dry_run=False):
     """
-    Recursively searches for files ending with a .tmpl extension under manifest_path
-    and copies the directory tree to repo_path.
+    Renders every service concurrently, then adds them all to the environment's kustomization
+    file in a single update.
+
+    The first rendering error is raised once every service has been tried, before the
+    kustomization file is touched.
     """
+    max_workers = int(os.environ.get("RENDER_MAX_SERVICES", "4"))
 
-    def ignore_func(_, files):
-        return [f for f in files if f[-5:] != '.tmpl']
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(render_service, service, services_to_deploy[service], gitops_environment_path, dry_run)
+            for service in services_to_deploy
+        ]
 
-    shutil.copytree(manifest_path, repo_path, ignore=ignore_func, dirs_exist_ok=True)
+    for future in futures:
+        future.result()
+
+    if not dry_run:
+        add_services_to_kustomization(os.path.join(gitops_environment_path, "kustomization.yaml"),
+                                      list(services_to_deploy))
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renders the service manifests into the GitOps repo.")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached Azure discovery results.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Print the diff of the rendered manifests without pushing them.")
+    args = parser.parse_args()
+    dry_run = args.dry_run or os.environ.get("RENDER_DRY_RUN", "false").lower() == "true"
     print("Post-Deplouy hook running...")
 
     set_env_from_azd()
     pre_req_assertions(TEMPLATE_FILE)
     environment_name = os.environ.get("AZURE_AKS_ENVIRONMENT_NAME")
     print("Logging in to GitHub...")
-    set_gh_pat_token()
+    set_gh_pat_token(refresh_requested(args))
     gh_pat = os.environ.get("GITHUB_TOKEN")
-    git_client = GitClient(gh_pat)
+    git_client = GitClient(gh_pat, os.environ.get("GITOPS_MIRROR_DIR", os.path.join(CWD, ".azure", "gitops")))
 
     if os.environ.get("GITHUB_TOKEN") is None:
         raise ValueError(
@@ -131,36 +202,21 @@ if __name__ == "__main__":
     with tempfile.TemporaryDirectory() as git_clone_dir:
         print('created temporary directory for git operations', git_clone_dir)
         print(f"Cloning {git_repo}...")
-        git_client.clone_repo(git_repo, release_branch, git_clone_dir)
+        clone_depth = os.environ.get("GITOPS_CLONE_DEPTH")
+        git_client.clone_repo(git_repo, release_branch, git_clone_dir,
+                              sparse_paths=[f"environments/{environment_name}"],
+                              depth=int(clone_depth) if clone_depth else None)
         print("Git clone successful.")
 
         services_to_deploy = get_services_to_deploy(TEMPLATE_FILE)
-
-        for service in services_to_deploy:
-            os.environ["SERVICE_NAME"] = service
-            print(f"Deploying service: {service}")
-            if "project" not in services_to_deploy[service]:
-                raise ValueError(
-                    f"Project directory path not found for service: {service}. \
-                        Please add a project property to the service in the yaml file."
-                )
-
-            project_dir = services_to_deploy[service]["project"]
-            manifest_dir = "manifests"
-
-            if "k8s" in services_to_deploy[service] \
-                and "deploymentPath" in services_to_deploy[service]["k8s"]:
-                manifest_dir = services_to_deploy[service]["k8s"]["deploymentPath"]
-
-            manifest_path = os.path.join(CWD, project_dir, manifest_dir)
-            gitops_environment_path = os.path.join(git_clone_dir, "environments", \
-                environment_name, "src", "manifests")
-            service_render_path = os.path.join(gitops_environment_path, "services", service)
-            copy_manifest_dir_tree_to_repo(manifest_path, service_render_path)
-            render_client = RenderEngine(service_render_path, \
-                                         os.path.join(gitops_environment_path, \
-                                            "kustomization.yaml"), \
-                                            service)
-            render_client.render()
-            git_client.push_changes(git_clone_dir, f"Deployed service: {service}")
-            print(f"Service {service} deployed successfully.")
+        gitops_environment_path = os.path.join(git_clone_dir, "environments", \
+            environment_name, "src", "manifests")
+        render_services(services_to_deploy, gitops_environment_path, dry_run)
+
+        if not dry_run:
+            # Every service is rendered before anything is pushed, so a failing render leaves the
+            # GitOps repo untouched and a successful deployment is a single commit.
+            if git_client.commit_and_push(git_clone_dir, f"Deployed services: {', '.join(services_to_deploy)}"):
+                print(f"Services {', '.join(services_to_deploy)} deployed successfully.")
+            else:
+                print("The GitOps repo is already up to date.")
@@ -1,6 +1,8 @@
+import argparse
 import os
 from pick import pick
-from wrappers.azure import AzureClient, AZD_ENVIRONMENT_NAME_RESOURCE_TAG
+from wrappers.azd import environment_dir
+from wrappers.azure import AzureClient, AZD_ENVIRONMENT_NAME_RESOURCE_TAG, refresh_requested
 
 def prompt_user_for_target_clusters(clusters):
     """
@@ -41,6 +43,9 @@ def prompt_user_for_target_clusters(clusters):
     return clusters[index - 1]
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Selects the AKS cluster to deploy to.")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached Azure discovery results.")
+    args = parser.parse_args()
     print("Pre-provisioning hook running...")
 
     # verify that the .azure folder exists
@@ -52,31 +57,52 @@ if __name__ == "__main__":
         )
 
     print("Getting active subscription ID...")
-    client = AzureClient()
-    subscription_id = client.get_active_subscription_id()
+    client = AzureClient(environment_dir(os.getcwd()), refresh_requested(args))
+    subscription_id = os.environ.get("AZURE_SUBSCRIPTION_ID") or client.get_active_subscription_id()
 
     if subscription_id is None:
         raise ValueError("No active subscription found. Please run 'az login' to log in to Azure.")
 
     print(f"Active subscription ID: {subscription_id}")
-    print("Getting AKS clusters...")
-    clusters = client.get_aks_clusters(subscription_id)
+    target_cluster = None
 
-    # Check if any clusters were found
-    if len(clusters) == 0:
-        raise ValueError(
-            f"No AKS clusters found. Please create an AKS cluster and set the \
-        {AZD_ENVIRONMENT_NAME_RESOURCE_TAG} tag."
+    # A previously provisioned environment already knows its cluster, so it is read directly
+    if os.environ.get("AZURE_AKS_CLUSTER_NAME") and os.environ.get("AZURE_RESOURCE_GROUP"):
+        print("Getting the AKS cluster...")
+        target_cluster = client.get_aks_cluster(
+            subscription_id, os.environ["AZURE_RESOURCE_GROUP"], os.environ["AZURE_AKS_CLUSTER_NAME"]
         )
 
-    target_cluster = prompt_user_for_target_clusters(clusters)
+    if target_cluster is None:
+        print("Getting AKS clusters...")
+        clusters = client.get_aks_clusters(subscription_id)
+
+        # Check if any clusters were found
+        if len(clusters) == 0:
+            raise ValueError(
+                f"No AKS clusters found. Please create an AKS cluster and set the \
+            {AZD_ENVIRONMENT_NAME_RESOURCE_TAG} tag."
+            )
+
+        target_cluster = prompt_user_for_target_clusters(clusters)
+
     kubelet_identity = target_cluster.addon_profiles["azureKeyvaultSecretsProvider"].identity
     resource_group_name = target_cluster.id.split("/")[4]
-    bb_keyvault = client.get_keyvault(
-        target_cluster.tags[AZD_ENVIRONMENT_NAME_RESOURCE_TAG], subscription_id, resource_group_name
+    print("Getting the key vault and container registry...")
+    known_resource_group = resource_group_name == os.environ.get("AZURE_RESOURCE_GROUP")
+    registry_endpoint = os.environ.get("AZURE_CONTAINER_REGISTRY_ENDPOINT")
+    bb_keyvault, registry = client.get_environment_resources(
+        target_cluster.tags[AZD_ENVIRONMENT_NAME_RESOURCE_TAG], subscription_id, resource_group_name,
+        keyvault_name=os.environ.get("AZURE_KEY_VAULT_NAME") if known_resource_group else None,
+        registry_name=registry_endpoint.split(".")[0] if known_resource_group and registry_endpoint else None,
     )
 
-    registry = client.get_container_registry(subscription_id, resource_group_name)
+    if bb_keyvault is None:
+        raise ValueError(
+            "No key vaults found. Please create a key vault and set the \
+        azd-env-name tag."
+        )
+
     tenant_id = bb_keyvault.properties.tenant_id
 
     if registry is None:
@@ -85,17 +111,17 @@ if __name__ == "__main__":
         and set the azd-container-registry-name tag."
         )
 
-    client.set_azd_env_variable("AZURE_AKS_CLUSTER_NAME", target_cluster.name)
-    client.set_azd_env_variable("AZURE_KEY_VAULT_ENDPOINT", bb_keyvault.properties.vault_uri)
-    client.set_azd_env_variable("AZURE_KEY_VAULT_NAME", bb_keyvault.name)
-    client.set_azd_env_variable("AZURE_AKS_KV_PROVIDER_CLIENT_ID", kubelet_identity.client_id)
-    client.set_azd_env_variable("AZURE_RESOURCE_GROUP", resource_group_name)
-    client.set_azd_env_variable("AZURE_AKS_ENVIRONMENT_NAME", \
-        target_cluster.tags[AZD_ENVIRONMENT_NAME_RESOURCE_TAG], True)
-    client.set_azd_env_variable("AZURE_TENANT_ID", tenant_id)
-    client.set_azd_env_variable("AZURE_CONTAINER_REGISTRY_ENDPOINT", registry.login_server)
-    client.set_azd_env_variable("GITOPS_REPO_RELEASE_BRANCH", \
-        target_cluster.tags["gitops-release-branch"], True)
-    client.set_azd_env_variable("GITOPS_REPO", target_cluster.tags["gitops-repo"], True)
+    client.set_azd_env_variables({
+        "AZURE_AKS_CLUSTER_NAME": target_cluster.name,
+        "AZURE_KEY_VAULT_ENDPOINT": bb_keyvault.properties.vault_uri,
+        "AZURE_KEY_VAULT_NAME": bb_keyvault.name,
+        "AZURE_AKS_KV_PROVIDER_CLIENT_ID": kubelet_identity.client_id,
+        "AZURE_RESOURCE_GROUP": resource_group_name,
+        "AZURE_AKS_ENVIRONMENT_NAME": target_cluster.tags[AZD_ENVIRONMENT_NAME_RESOURCE_TAG],
+        "AZURE_TENANT_ID": tenant_id,
+        "AZURE_CONTAINER_REGISTRY_ENDPOINT": registry.login_server,
+        "GITOPS_REPO_RELEASE_BRANCH": target_cluster.tags["gitops-release-branch"],
+        "GITOPS_REPO": target_cluster.tags["gitops-repo"],
+    }, export=True)
 
     print("Pre-provisioning hook complete.")
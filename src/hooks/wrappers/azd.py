@@ -0,0 +1,183 @@
+import json
+import os
+import re
+import stat
+import subprocess
+import tempfile
+
+# A dotenv line as written by azd: KEY=value, KEY="escaped value" or KEY='literal value'
+DOTENV_LINE = re.compile(
+    r"""^\s*(?:export\s+)?(?P<key>[A-Za-z_][A-Za-z0-9_.]*)\s*=\s*"""
+    r"""(?:"(?P<double>(?:[^"\\]|\\.)*)"|'(?P<single>[^']*)'|(?P<bare>.*?))\s*(?:\s#.*)?$"""
+)
+DOUBLE_QUOTE_ESCAPES = {"n": "\n", "r": "\r"}
+# The characters azd escapes inside double-quoted values
+DOUBLE_QUOTE_SPECIAL_CHARS = '\\\n\r"!$`'
+
+
+def parse_dotenv(text):
+    """
+    Parses the dotenv format used by azd environments.
+
+    Double-quoted values are unescaped, single-quoted values are taken literally, and values may
+    contain '='.
+
+    Args:
+        text (str): The dotenv file content or 'azd env get-values' output.
+
+    Returns:
+        dict: The environment values by name.
+    """
+    values = {}
+    for line in text.splitlines():
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+
+        match = DOTENV_LINE.match(line)
+        if match is None:
+            raise ValueError(f"Invalid azd environment line: {line}")
+
+        if match["double"] is not None:
+            value = re.sub(r"\\(.)", lambda escape: DOUBLE_QUOTE_ESCAPES.get(escape[1], escape[1]), match["double"])
+        elif match["single"] is not None:
+            value = match["single"]
+        else:
+            value = match["bare"]
+
+        values[match["key"]] = value
+
+    return values
+
+
+def format_dotenv(values):
+    """
+    Formats environment values the way azd writes them: sorted by name and double-quoted.
+    """
+    lines = []
+    for key, value in sorted(values.items()):
+        escaped = "".join(
+            "\\n" if char == "\n" else "\\r" if char == "\r" else f"\\{char}"
+            if char in DOUBLE_QUOTE_SPECIAL_CHARS else char
+            for char in value
+        )
+        lines.append(f'{key}="{escaped}"\n')
+
+    return "".join(lines)
+
+
+def environment_dir(root):
+    """
+    Returns the .azure/<environment> directory of the active azd environment under root, or None
+    if there is none.
+
+    The environment is read from AZURE_ENV_NAME, which azd sets for hooks, or else from the
+    defaultEnvironment in .azure/config.json.
+    """
+    azure_dir = os.path.join(root, ".azure")
+    env_name = os.environ.get("AZURE_ENV_NAME")
+
+    if not env_name:
+        try:
+            with open(os.path.join(azure_dir, "config.json"), "r", encoding="utf-8") as r_stream:
+                env_name = json.load(r_stream).get("defaultEnvironment")
+        except (OSError, ValueError):
+            return None
+
+    env_dir = os.path.join(azure_dir, env_name) if env_name else None
+
+    return env_dir if env_dir is not None and os.path.isdir(env_dir) else None
+
+
+class AzdEnvironment:
+    """
+    Reads and writes the values of an azd environment.
+
+    When the environment's directory is known, its .env file is read and written directly, which
+    replaces one 'azd' process per value. Otherwise the azd CLI is used.
+    """
+
+    def __init__(self, env_dir=None, cwd=None):
+        """
+        Initializes a new instance of the AzdEnvironment class.
+
+        Args:
+            env_dir (str): The .azure/<environment> directory, or None to go through the azd CLI.
+            cwd (str): The project directory the azd CLI is run for.
+        """
+        self.path = os.path.join(env_dir, ".env") if env_dir else None
+        self.cwd = cwd
+        self._values = None
+        self._mtime = None
+
+    def values(self):
+        """
+        Returns the environment values. The file is only parsed again once it has changed.
+
+        Returns:
+            dict: The environment values by name.
+        """
+        if self.path is None:
+            if self._values is None:
+                command = ["azd", "env", "get-values"] + (["--cwd", self.cwd] if self.cwd else [])
+                self._values = parse_dotenv(subprocess.check_output(command, universal_newlines=True))
+            return dict(self._values)
+
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if self._values is None or mtime != self._mtime:
+            if mtime is None:
+                self._values = {}
+            else:
+                with open(self.path, "r", encoding="utf-8") as r_stream:
+                    self._values = parse_dotenv(r_stream.read())
+            self._mtime = mtime
+
+        return dict(self._values)
+
+    def update(self, values):
+        """
+        Sets environment values in a single write. Values that are already set are not rewritten.
+
+        The file is replaced atomically, so azd never reads a partially written environment.
+
+        Args:
+            values (dict): The values to set by name.
+
+        Returns:
+            list[str]: The names of the values that changed.
+        """
+        current = self.values()
+        changed = sorted(key for key, value in values.items() if current.get(key) != value)
+        if not changed:
+            return changed
+
+        current.update((key, values[key]) for key in changed)
+
+        if self.path is None:
+            for key in changed:
+                subprocess.check_output(
+                    ["azd", "env", "set", key, values[key]] + (["--cwd", self.cwd] if self.cwd else []),
+                    universal_newlines=True,
+                )
+            self._values = current
+            return changed
+
+        directory = os.path.dirname(self.path)
+        fd, temporary_path = tempfile.mkstemp(prefix=".env.", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as w_stream:
+                w_stream.write(format_dotenv(current))
+            if self._mtime is not None:
+                os.chmod(temporary_path, stat.S_IMODE(os.stat(self.path).st_mode))
+            os.replace(temporary_path, self.path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+        self._values = current
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+        return changed
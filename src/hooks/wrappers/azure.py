@@ -1,6 +1,13 @@
+import functools
+import json
 import subprocess
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
+from azure.core.pipeline.transport import RequestsTransport
 from azure.identity import DefaultAzureCredential
 from azure.mgmt.containerservice import ContainerServiceClient
 from azure.mgmt.subscription import SubscriptionClient
@@ -9,8 +16,171 @@ from azure.core.exceptions import HttpResponseError, ClientAuthenticationError,
 from azure.mgmt.keyvault import KeyVaultManagementClient
 from azure.keyvault.secrets import SecretClient
 from azure.mgmt.containerregistry import ContainerRegistryManagementClient
+from azure.mgmt.containerregistry.models import Registry
+from azure.mgmt.containerservice.models import ManagedCluster
+from azure.mgmt.keyvault.models import Vault
+
+from .azd import AzdEnvironment
 
 AZD_ENVIRONMENT_NAME_RESOURCE_TAG = "azd-env-name"
+# Tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 300
+DISCOVERY_CACHE_FILE = "discovery-cache.json"
+# Seconds each kind of discovery result is reused for. Cluster lists change most often.
+# The active subscription is not cached: it changes with 'az account set' and the signed-in
+# account, which are not part of the cache key.
+DISCOVERY_CACHE_TTLS = {
+    "aks_clusters": 3600,
+    "aks_cluster": 24 * 3600,
+    "keyvault": 24 * 3600,
+    "container_registry": 24 * 3600,
+}
+
+
+class DiscoveryCache:
+    """
+    Keeps Azure discovery results in a JSON file, so repeated hook runs skip the ARM queries.
+
+    Each entry is stored with its write time and is ignored once it is older than the TTL of its
+    kind. Only resource metadata is stored, never secrets.
+    """
+
+    def __init__(self, path):
+        """
+        Initializes a new instance of the DiscoveryCache class.
+
+        Args:
+            path (str): The JSON file the cache is kept in.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+        try:
+            with open(path, "r", encoding="utf-8") as r_stream:
+                self._entries = json.load(r_stream)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, key, ttl):
+        """
+        Returns the cached value of the key, or None if it is missing or older than ttl seconds.
+        """
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry["stored_at"] > ttl:
+            return None
+
+        return entry["value"]
+
+    def set(self, key, value):
+        """
+        Stores the value of the key and writes the cache file.
+        """
+        with self._lock:
+            self._entries[key] = {"stored_at": time.time(), "value": value}
+            self._write()
+
+    def clear(self):
+        """
+        Drops every cached value.
+        """
+        with self._lock:
+            self._entries = {}
+            self._write()
+
+    def _write(self):
+        # Written to a temporary file first, so an interrupted run never leaves a truncated cache
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as w_stream:
+            json.dump(self._entries, w_stream)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+def _cached(kind, model_class=None):
+    """
+    Caches the result of an AzureClient lookup in its discovery cache, keyed by the lookup's
+    arguments, such as the subscription, resource group and environment name.
+
+    Args:
+        kind (str): The kind of result, which selects its TTL in DISCOVERY_CACHE_TTLS.
+        model_class (type): The Azure SDK model returned by the lookup, alone or in a list, or None
+            for a plain JSON value.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self._cache is None:
+                return method(self, *args, **kwargs)
+
+            arguments = [*map(str, args), *(f"{name}={value}" for name, value in sorted(kwargs.items()))]
+            key = "/".join([kind, *arguments])
+            cached = self._cache.get(key, DISCOVERY_CACHE_TTLS[kind])
+            if cached is not None:
+                return _from_json(model_class, cached)
+
+            value = method(self, *args, **kwargs)
+
+            # Failed and empty lookups are not cached, so newly created resources are found
+            if value:
+                self._cache.set(key, _to_json(model_class, value))
+
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def _to_json(model_class, value):
+    if model_class is None:
+        return value
+    if isinstance(value, list):
+        return [model.as_dict() for model in value]
+
+    return value.as_dict()
+
+
+def _from_json(model_class, value):
+    if model_class is None:
+        return value
+    if isinstance(value, list):
+        return [model_class(model) for model in value]
+
+    return model_class(value)
+
+
+def refresh_requested(args):
+    """
+    Returns True if a hook was run with --refresh or with AZURE_DISCOVERY_REFRESH set to true.
+
+    azd runs hooks without arguments, so the environment variable is how 'azd provision' and
+    'azd deploy' ask for fresh results.
+    """
+    return args.refresh or os.environ.get("AZURE_DISCOVERY_REFRESH", "false").lower() == "true"
+
+
+class CachingCredential:
+    """
+    Shares access tokens between every client built from the wrapped credential.
+
+    The Azure CLI credential used by DefaultAzureCredential on developer machines does not cache
+    tokens, so without this every management client would start its own 'az' process to get one.
+    """
+
+    def __init__(self, credential):
+        self._credential = credential
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, *scopes, **kwargs):
+        key = (scopes, tuple(sorted(kwargs.items())))
+
+        # Concurrent requests for the same token wait for the first one instead of racing it
+        with self._lock:
+            token = self._tokens.get(key)
+            if token is None or token.expires_on - TOKEN_REFRESH_MARGIN < time.time():
+                token = self._tokens[key] = self._credential.get_token(*scopes, **kwargs)
+
+        return token
 
 
 class AzureClient:
@@ -21,8 +191,27 @@ class AzureClient:
     clusters and GitHub PATs.
     """
 
-    def __init__(self):
-        self._credential = DefaultAzureCredential()
+    def __init__(self, env_dir=None, refresh=False):
+        """
+        Initializes a new instance of the AzureClient class.
+
+        Args:
+            env_dir (str): The .azure/<environment> directory of the azd environment. Discovery
+                results are cached there and environment values are written to its .env file.
+                When it is None, lookups are not cached and values are set through the azd CLI.
+            refresh (bool): Drops every cached lookup, so resources are discovered again.
+        """
+        self._credential = CachingCredential(DefaultAzureCredential())
+        # Every client sends its requests through one connection pool
+        self._session = requests.Session()
+        self._clients = {}
+        self._secrets = {}
+        self._lock = threading.Lock()
+        self._cache = DiscoveryCache(os.path.join(env_dir, DISCOVERY_CACHE_FILE)) if env_dir else None
+        self._azd_env = AzdEnvironment(env_dir)
+
+        if refresh and self._cache is not None:
+            self._cache.clear()
 
     def set_azd_env_variable(self, name, value, export=False):
         """
@@ -35,14 +224,28 @@ class AzureClient:
         Returns:
             None
         """
-        print(f"Setting {name} environment variable...")
+        self.set_azd_env_variables({name: value}, export)
+
+    def set_azd_env_variables(self, values, export=False):
+        """
+        Sets Azure Developer CLI environment variables in a single write.
+
+        Values that are already set are not written again.
+
+        Args:
+            values (dict): The values to set by name.
+            export (bool): Also sets the values in the environment of this process.
+
+        Returns:
+            None
+        """
+        print(f"Setting {', '.join(values)} environment variables...")
         try:
-            standard_out = subprocess.check_output(["azd", "env", "set", name, value], \
-                universal_newlines=True)
-            print(standard_out)
+            changed = self._azd_env.update(values)
+            print(f"Updated {len(changed)} of {len(values)} environment variables.")
 
             if export:
-                os.environ[name] = value
+                os.environ.update(values)
 
         except subprocess.CalledProcessError as ex:
             print(f" Error: {ex.output}")
@@ -54,13 +257,37 @@ class AzureClient:
         :return: The subscription ID of the active subscription, or None if an error occurred.
         """
         try:
-            sub_client = SubscriptionClient(self._credential)
+            sub_client = SubscriptionClient(self._credential, transport=self._transport())
             subscription = next(sub_client.subscriptions.list())
             return subscription.subscription_id
         except (HttpResponseError, ClientAuthenticationError) as exc:
             print(f"Error occurred while getting subscription ID: {exc}")
             return None
 
+    def _get_client(self, client_class, subscription_id):
+        """
+        Returns the management client of the given class for the specified subscription ID.
+
+        Clients are created once and reused, and all of them share the credential and the HTTP
+        connection pool of this AzureClient.
+
+        Args:
+            client_class (type): The management client class, such as KeyVaultManagementClient.
+            subscription_id (str): The ID of the Azure subscription.
+
+        Returns:
+            The management client.
+        """
+        with self._lock:
+            key = (client_class, subscription_id)
+            if key not in self._clients:
+                self._clients[key] = client_class(self._credential, subscription_id, transport=self._transport())
+
+            return self._clients[key]
+
+    def _transport(self):
+        return RequestsTransport(session=self._session, session_owner=False)
+
     def _parse_resource_group_from_id(self, resource_id):
         """
         Returns the resource group name from the specified resource ID.
@@ -86,41 +313,50 @@ class AzureClient:
             creating the client object.
         """
         try:
-            return ContainerServiceClient(self._credential, subscription_id)
+            return self._get_client(ContainerServiceClient, subscription_id)
         except (HttpResponseError, ClientAuthenticationError) as exc:
             print(f"Error occurred while creating ContainerServiceClient: {exc}")
             return None
 
-    def get_container_registry(self, subscription_id, resource_group_name):
+    @_cached("container_registry", Registry)
+    def get_container_registry(self, subscription_id, resource_group_name, registry_name=None, azd_env_name=None):
         """
-        Returns a list of container registries in the specified resource group.
+        Returns the first container registry in the specified resource group that has the
+        'azd-env-name' tag set, to azd_env_name if one is given.
+
+        Registries are listed lazily and listing stops at the first match. When the registry name
+        is already known, the registry is read directly, and the resource group is only listed if
+        it does not exist or is not tagged for the environment.
 
         Args:
             subscription_id (str): The ID of the Azure subscription.
             resource_group_name (str): The name of the resource group.
+            registry_name (str): The name of the registry, if known.
+            azd_env_name (str): The name of the AZD environment the registry must be tagged with.
 
         Returns:
-            List of ContainerRegistry objects, or None if an error occurred.
+            A ContainerRegistry object, or None if none was found or an error occurred.
         """
         try:
-            container_registry_client = ContainerRegistryManagementClient(self._credential, subscription_id)
-            registries = container_registry_client.registries.list_by_resource_group(resource_group_name)
+            container_registry_client = self._get_client(ContainerRegistryManagementClient, subscription_id)
 
-            reduced_registries = [
-                registry
-                for registry in registries
-                if AZD_ENVIRONMENT_NAME_RESOURCE_TAG in registry.tags
-                and registry.tags.get(AZD_ENVIRONMENT_NAME_RESOURCE_TAG)
-            ]
+            if registry_name:
+                registry = _get_tagged(
+                    lambda: container_registry_client.registries.get(resource_group_name, registry_name),
+                    azd_env_name,
+                )
+                if registry is not None:
+                    return registry
+                print(f"Container registry {registry_name} is not tagged for the environment, listing registries...")
 
-            if len(reduced_registries) == 0:
-                return None
+            registries = container_registry_client.registries.list_by_resource_group(resource_group_name)
 
-            return reduced_registries[0]
+            return _first_tagged(registries, azd_env_name)
         except (HttpResponseError, ClientAuthenticationError) as exc:
             print(f"Error occurred while getting container registries: {exc}")
             return None
 
+    @_cached("aks_clusters", ManagedCluster)
     def get_aks_clusters(self, subscription_id):
         """
         Returns a list of AKS clusters that have the 'azd-env-name' tag set.
@@ -134,50 +370,103 @@ class AzureClient:
         try:
             container_service_client = self.get_container_service_client(subscription_id)
             aks_clusters = container_service_client.managed_clusters.list()
-            return [
-                cluster
-                for cluster in aks_clusters
-                if AZD_ENVIRONMENT_NAME_RESOURCE_TAG in cluster.tags
-                and cluster.tags.get(AZD_ENVIRONMENT_NAME_RESOURCE_TAG)
-            ]
+            return [cluster for cluster in aks_clusters if _has_environment_tag(cluster)]
         except (HttpResponseError, ClientAuthenticationError) as exc:
             print(f"Error occurred while getting AKS clusters: {exc}")
             return None
 
-    def get_keyvault(self, azd_env_name, subscription_id, resource_group_name):
+    @_cached("aks_cluster", ManagedCluster)
+    def get_aks_cluster(self, subscription_id, resource_group_name, cluster_name):
+        """
+        Returns the AKS cluster with the given name, without listing the subscription's clusters.
+
+        Args:
+            subscription_id (str): The ID of the Azure subscription.
+            resource_group_name (str): The name of the resource group.
+            cluster_name (str): The name of the AKS cluster.
+
+        Returns:
+            The AKS cluster, or None if it has no 'azd-env-name' tag or an error occurred.
+        """
+        try:
+            container_service_client = self.get_container_service_client(subscription_id)
+            cluster = container_service_client.managed_clusters.get(resource_group_name, cluster_name)
+
+            return cluster if _has_environment_tag(cluster) else None
+        except (HttpResponseError, ClientAuthenticationError) as exc:
+            print(f"Error occurred while getting AKS cluster {cluster_name}: {exc}")
+            return None
+
+    @_cached("keyvault", Vault)
+    def get_keyvault(self, azd_env_name, subscription_id, resource_group_name, keyvault_name=None):
         """
         Returns the Software Factory KeyVault within the specified resource group.
 
+        Only the vaults of the resource group are listed, lazily, and listing stops at the first
+        vault tagged with the environment name. When the vault name is already known, the vault is
+        read directly, and the resource group is only listed if it does not exist or is not tagged
+        with the environment name, such as when the name comes from a stale azd environment.
+
         Args:
             azd_env_name (str): The name of the AZD environment.
             subscription_id (str): The ID of the Azure subscription.
             resource_group_name (str): The name of the resource group.
+            keyvault_name (str): The name of the KeyVault, if known.
 
         Returns:
             A KeyVault object, or None if an error occurred.
         """
         try:
-            kv_client = KeyVaultManagementClient(self._credential, subscription_id)
-            reduced_keyvaults = [
-                keyvault
-                for keyvault in kv_client.vaults.list()
-                if self._parse_resource_group_from_id(keyvault.id) == resource_group_name
-                and AZD_ENVIRONMENT_NAME_RESOURCE_TAG in keyvault.tags
-                and keyvault.tags.get(AZD_ENVIRONMENT_NAME_RESOURCE_TAG) == azd_env_name
-            ]
-
-            if len(reduced_keyvaults) == 0:
+            kv_client = self._get_client(KeyVaultManagementClient, subscription_id)
+
+            if keyvault_name:
+                keyvault = _get_tagged(lambda: kv_client.vaults.get(resource_group_name, keyvault_name), azd_env_name)
+                if keyvault is not None:
+                    return keyvault
+                print(f"KeyVault {keyvault_name} is not tagged for environment {azd_env_name}, listing KeyVaults...")
+
+            keyvault = _first_tagged(kv_client.vaults.list_by_resource_group(resource_group_name), azd_env_name)
+
+            if keyvault is None:
                 raise ValueError(f"No KeyVaults found for environment: {azd_env_name}")
 
-            return kv_client.vaults.get(resource_group_name, reduced_keyvaults[0].name)
+            return keyvault
         except (HttpResponseError, ClientAuthenticationError, ValueError) as exc:
             print(f"Error occurred while getting KeyVaults: {exc}")
             return None
 
+    def get_environment_resources(self, azd_env_name, subscription_id, resource_group_name,
+                                  keyvault_name=None, registry_name=None):
+        """
+        Returns the KeyVault and the container registry of an environment, fetched concurrently.
+
+        Args:
+            azd_env_name (str): The name of the AZD environment.
+            subscription_id (str): The ID of the Azure subscription.
+            resource_group_name (str): The name of the resource group.
+            keyvault_name (str): The name of the KeyVault, if known.
+            registry_name (str): The name of the container registry, if known.
+
+        Returns:
+            A (KeyVault, ContainerRegistry) tuple. Either is None if it could not be found.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            keyvault = executor.submit(
+                self.get_keyvault, azd_env_name, subscription_id, resource_group_name, keyvault_name
+            )
+            registry = executor.submit(
+                self.get_container_registry, subscription_id, resource_group_name, registry_name, azd_env_name
+            )
+
+            return keyvault.result(), registry.result()
+
     def get_keyvault_secret(self, keyvault, secret_name):
         """
         Retrieves the specified secret from the specified Azure Key Vault.
 
+        Secrets are cached in memory for the lifetime of the client and never written to the
+        discovery cache.
+
         Args:
             keyvault (KeyVault): The KeyVault object representing the Azure Key 
             Vault to retrieve the secret from.
@@ -190,9 +479,13 @@ class AzureClient:
             if keyvault is None:
                 raise ValueError("KeyVault is None")
 
+            key = (keyvault.properties.vault_uri, secret_name)
+            if key in self._secrets:
+                return self._secrets[key]
+
             # Get the secret from the keyvault
             secret_client = SecretClient(vault_url=keyvault.properties.vault_uri, \
-                                         credential=self._credential)
+                                         credential=self._credential, transport=self._transport())
             if secret_client is None:
                 raise ValueError("SecretClient is None")
 
@@ -200,8 +493,38 @@ class AzureClient:
             secret = secret_client.get_secret(secret_name)
 
             # Return the secret value
+            self._secrets[key] = secret.value
             return secret.value
         except (HttpResponseError, ClientAuthenticationError, \
                 ValueError, ResourceNotFoundError) as exc:
             print(f"Error occurred while getting the KeyVault secret {secret_name}: {exc}")
             return None
+
+
+def _has_environment_tag(resource, azd_env_name=None):
+    """
+    Returns True if the resource has the 'azd-env-name' tag set, to azd_env_name if one is given.
+    """
+    value = (resource.tags or {}).get(AZD_ENVIRONMENT_NAME_RESOURCE_TAG)
+
+    return bool(value) if azd_env_name is None else value == azd_env_name
+
+
+def _get_tagged(get_resource, azd_env_name=None):
+    """
+    Returns the resource read by get_resource if it exists and has the 'azd-env-name' tag set, to
+    azd_env_name if one is given, otherwise None.
+    """
+    try:
+        resource = get_resource()
+    except ResourceNotFoundError:
+        return None
+
+    return resource if _has_environment_tag(resource, azd_env_name) else None
+
+
+def _first_tagged(resources, azd_env_name=None):
+    """
+    Returns the first resource with the 'azd-env-name' tag set, without fetching further pages.
+    """
+    return next((resource for resource in resources if _has_environment_tag(resource, azd_env_name)), None)
@@ -1,11 +1,20 @@
-import subprocess
+import base64
+import fcntl
 import os
+import tempfile
+from contextlib import contextmanager
 import git
 
 class GitClient:
-    def __init__(self, gh_pat):
+    def __init__(self, gh_pat, mirror_dir=None, base_url="https://github.com"):
         """
-        Logs in to GitHub using either the GITHUB_TOKEN environment variable or the gh CLI.
+        Authenticates git operations on GitHub with a PAT.
+
+        Args:
+            gh_pat (str): The GitHub PAT used for fetches and pushes.
+            mirror_dir (str): The directory that keeps a bare mirror of every cloned repository
+                between deployments. Defaults to a directory in the system's temporary directory.
+            base_url (str): The URL repository names are resolved against.
         """
         # Clone private repository using GITHUB_TOKEN
 
@@ -14,6 +23,33 @@ class GitClient:
                              GITHUB_TOKEN environment variable.")
 
         self.pat_token = gh_pat
+        self.mirror_dir = mirror_dir or os.path.join(tempfile.gettempdir(), "gitops-mirrors")
+        self.base_url = base_url
+        self.worktree_branches = {}
+
+    def __auth_env(self):
+        """
+        Returns the environment that authenticates git's HTTP requests with the PAT.
+
+        The token is passed as an extra header through the environment, so it is neither written
+        to the mirror's config nor visible in the process list.
+        """
+        credentials = base64.b64encode(f"x-access-token:{self.pat_token}".encode("utf-8")).decode("ascii")
+
+        return {
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": "http.extraheader",
+            "GIT_CONFIG_VALUE_0": f"AUTHORIZATION: basic {credentials}",
+            "GIT_TERMINAL_PROMPT": "0",
+        }
+
+    def __git(self, path):
+        """
+        Returns a git command runner for path that authenticates with the PAT.
+        """
+        runner = git.Git(path)
+        runner.update_environment(**self.__auth_env())
+        return runner
 
     def push_changes(self, repo_dir, commit_message):
         """
@@ -26,43 +62,141 @@ class GitClient:
             raise ValueError("commit_message cannot be None")
 
         try:
-            repo = git.Repo(repo_dir)
-            repo.git.add(".")
-            repo.index.commit(commit_message)
-            repo.git.push()
+            repo = self.__git(repo_dir)
+            repo.add(".")
+            repo.commit("-m", commit_message)
+            if repo_dir in self.worktree_branches:
+                repo.push("origin", f"HEAD:refs/heads/{self.worktree_branches[repo_dir]}")
+            else:
+                repo.push()
         except git.exc.GitCommandError as ex:
             print(f"Error pushing changes: Exception: {ex}")
 
-    def __run_command(self, command):
+    def commit_and_push(self, repo_dir, commit_message, max_attempts=3):
         """
-        Runs a command in the shell and returns its output.
+        Commits every change in a repository at once and pushes the commit.
+
+        Nothing is committed or pushed when there are no changes. When the push is rejected
+        because the branch moved on, the commit is rebased onto the fetched branch and pushed
+        again, up to max_attempts times in total.
+
+        Args:
+            repo_dir (str): The repository or worktree directory.
+            commit_message (str): The commit message.
+            max_attempts (int): The number of pushes attempted.
+
+        Returns:
+            bool: Whether a commit was pushed.
         """
-        try:
-            output = subprocess.check_output(command, stderr=subprocess.STDOUT, \
-                                             universal_newlines=True, shell=True)
-            return output.strip()
-        except subprocess.CalledProcessError as ex:
-            print(f"Error: {ex.output}")
-            return None
+        if repo_dir is None:
+            raise ValueError("repo_dir cannot be None")
+
+        if commit_message is None:
+            raise ValueError("commit_message cannot be None")
 
-    def __run_gh_cli_command(self, command, args):
+        repo = self.__git(repo_dir)
+        repo.add("-A", ".")
+        # --quiet exits with 1 when the index differs from HEAD
+        if repo.diff("--cached", "--quiet", with_extended_output=True, with_exceptions=False)[0] == 0:
+            print("No changes to commit.")
+            return False
+
+        repo.commit("-m", commit_message)
+        branch = self.worktree_branches.get(repo_dir) or repo.rev_parse("--abbrev-ref", "HEAD")
+
+        for attempt in range(1, max_attempts + 1):
+            try:
+                repo.push("origin", f"HEAD:refs/heads/{branch}")
+                return True
+            except git.exc.GitCommandError as ex:
+                if attempt == max_attempts or "rejected" not in str(ex):
+                    print(f"Error pushing changes: Exception: {ex}")
+                    raise
+
+            print(f"Push to {branch} was rejected, rebasing onto the latest commit...")
+            repo.fetch("origin", f"+refs/heads/{branch}:refs/remotes/origin/{branch}")
+            try:
+                repo.rebase(f"refs/remotes/origin/{branch}")
+            except git.exc.GitCommandError:
+                repo.rebase("--abort")
+                raise
+
+        return False
+
+    def mirror_path(self, repo_name):
         """
-        Runs a command in the gh CLI and returns its output.
+        Returns the path of the bare mirror of a repository.
         """
-        return self.__run_command(["gh", command] + args)
+        return os.path.join(self.mirror_dir, f"{repo_name.replace('/', '_')}.git")
 
-    def clone_repo(self, repo_name, target_branch, directory):
+    @contextmanager
+    def __mirror_lock(self, mirror_path):
         """
-        Clones a GitHub repository to a local directory.
+        Serializes fetches into the same mirror across concurrent deployments.
+        """
+        os.makedirs(self.mirror_dir, exist_ok=True)
+        with open(f"{mirror_path}.lock", "w", encoding="utf-8") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __update_mirror(self, repo_name, target_branch, depth=None):
+        """
+        Creates the bare mirror of a repository if needed and fetches the target branch into it.
+
+        The mirror is a partial clone without blobs, so a fetch only transfers the commits and
+        trees added since the previous deployment. Blobs are fetched when a worktree checks them
+        out.
+        """
+        mirror_path = self.mirror_path(repo_name)
+        if not os.path.exists(os.path.join(mirror_path, "HEAD")):
+            git.Repo.init(mirror_path, bare=True)
+            mirror = git.Git(mirror_path)
+            mirror.config("core.repositoryformatversion", "1")
+            mirror.config("extensions.partialClone", "origin")
+            mirror.config("remote.origin.promisor", "true")
+            mirror.config("remote.origin.partialclonefilter", "blob:none")
+
+        mirror = self.__git(mirror_path)
+        mirror.config("remote.origin.url", f"{self.base_url}/{repo_name}")
+        fetch_args = ["--filter=blob:none", "--prune"] + ([f"--depth={depth}"] if depth else [])
+        mirror.fetch(*fetch_args, "origin", f"+refs/heads/{target_branch}:refs/remotes/origin/{target_branch}")
+
+        return mirror
+
+    def clone_repo(self, repo_name, target_branch, directory, sparse_paths=None, depth=None):
+        """
+        Checks out a GitHub repository to a local directory.
+
+        The checkout is a worktree of a bare mirror kept in mirror_dir, which only fetches what
+        changed since the last deployment. directory must not exist or be empty.
+
+        Args:
+            repo_name (str): The repository, as owner/name.
+            target_branch (str): The branch to check out and push to.
+            directory (str): The directory of the worktree.
+            sparse_paths (list[str]): The directories to check out, or None for all of them.
+            depth (int): The number of commits of history to fetch, or None for all of them.
         """
         if repo_name is None:
             raise ValueError("repo_name cannot be None")
 
-        git_url = f"https://{self.pat_token}@github.com/{repo_name}"
-        self.__run_gh_cli_command("auth", ["setup-git"])
+        mirror_path = self.mirror_path(repo_name)
 
         try:
-            git.Repo.clone_from(git_url, directory, branch=target_branch, \
-                                env={"GITHUB_TOKEN": os.environ.get("GITHUB_TOKEN")})
+            with self.__mirror_lock(mirror_path):
+                mirror = self.__update_mirror(repo_name, target_branch, depth)
+                # Forget the worktrees of earlier deployments whose directories were removed
+                mirror.worktree("prune")
+                mirror.worktree("add", "--no-checkout", "--detach", directory,
+                                f"refs/remotes/origin/{target_branch}")
+
+            worktree = self.__git(directory)
+            if sparse_paths:
+                worktree.sparse_checkout("set", "--cone", *sparse_paths)
+            worktree.checkout()
+            self.worktree_branches[directory] = target_branch
         except git.exc.GitCommandError as ex:
             print(f"Error cloning repo {repo_name}: Exception: {ex}")
@@ -1,13 +1,106 @@
+import difflib
+import hashlib
+import json
 import os
-import subprocess
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import yaml
 
+# The references envsubst replaces: $NAME and ${NAME}. Anything else, such as ${NAME:-default}, is
+# left as it is.
+VARIABLE_PATTERN = re.compile(r"\$(?:\{([A-Za-z_][A-Za-z0-9_]*)\}|([A-Za-z_][A-Za-z0-9_]*))")
+RENDER_MANIFEST_FILE = ".render-manifest.json"
+
+
+class UndefinedVariableError(ValueError):
+    """
+    Raised in strict mode when a template references variables that are not defined.
+    """
+
+    def __init__(self, path, names):
+        super().__init__(f"Undefined variables in {path}: {', '.join(sorted(names))}")
+        self.path = path
+        self.names = names
+
+
+class Template:
+    """
+    A template parsed into its literal text and the variables referenced between it.
+    """
+
+    def __init__(self, text):
+        """
+        Initializes a new instance of the Template class.
+
+        Args:
+            text (str): The template text.
+        """
+        parts = VARIABLE_PATTERN.split(text)
+        # split() returns the literal text followed by both capture groups of every reference
+        self.literals = parts[0::3]
+        self.names = [braced or bare for braced, bare in zip(parts[1::3], parts[2::3])]
+        self.digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def input_digest(self, variables):
+        """
+        Returns a hash of the template text and the values of the variables it references.
+
+        The rendered output only changes when this hash does.
+        """
+        values = {name: variables.get(name) for name in sorted(set(self.names))}
+
+        return hashlib.sha256(f"{self.digest}\n{json.dumps(values)}".encode("utf-8")).hexdigest()
+
+    def render(self, variables, strict=False, path=None):
+        """
+        Substitutes the variables with envsubst semantics: undefined variables become empty.
+
+        Args:
+            variables (dict): The variable values by name.
+            strict (bool): Raises UndefinedVariableError instead of substituting empty values.
+            path (str): The template's path, used in error messages.
+
+        Returns:
+            str: The rendered text.
+        """
+        if strict:
+            undefined = {name for name in self.names if name not in variables}
+            if undefined:
+                raise UndefinedVariableError(path, undefined)
+
+        rendered = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            rendered.append(variables.get(name, ""))
+            rendered.append(literal)
+
+        return "".join(rendered)
+
+
+@lru_cache(maxsize=1024)
+def _load_template(path, mtime_ns):
+    """
+    Parses a template file. Parsed templates are cached until the file is modified.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as r_stream:
+        return Template(r_stream.read())
+
+
+def load_template(path):
+    """
+    Returns the parsed template of a file, from the cache if the file is unchanged.
+    """
+    return _load_template(path, os.stat(path).st_mtime_ns)
+
+
 class RenderEngine:
     """
     The RenderEngine class provides functionality to render K8 templates 
     and add a service to a kustomization file.
     """
-    def __init__(self, path, kustomization_path, service_name):
+    def __init__(self, path, kustomization_path, service_name, strict=False, max_workers=None,
+                 dry_run=False, output_path=None, variables=None, manifest_path=None):
         """
         Initializes a new instance of the RenderEngine class.
 
@@ -15,11 +108,28 @@ class RenderEngine:
             path (str): The path to the directory containing the templates to render.
             kustomization_path (str): The path to the kustomization file.
             service_name (str): The name of the service to add to the kustomization file.
+            strict (bool): Fails on templates that reference undefined variables instead of
+                substituting empty values like envsubst.
+            max_workers (int): The number of threads rendering templates concurrently.
+            dry_run (bool): Prints the diff of every output that would change instead of
+                writing it.
+            output_path (str): The directory the outputs are written to, keeping the directory
+                structure of the templates. Defaults to rendering next to the templates.
+            variables (dict): The variable values by name. Defaults to the environment variables
+                at the time of rendering.
+            manifest_path (str): The file keeping the hashes of the last render. Defaults to a
+                file in the output directory, so pass a path outside of it when the outputs are
+                pushed to a repository.
         """
         self.path = path
+        self.output_path = output_path or path
         self.service_name = service_name
         self.kustomization_path = kustomization_path
-        self.remove_template_file = True
+        self.strict = strict
+        self.max_workers = max_workers
+        self.dry_run = dry_run
+        self.variables = variables
+        self.manifest_path = manifest_path or os.path.join(self.output_path, RENDER_MANIFEST_FILE)
 
     def __retrieve_files_to_render(self):
         """
@@ -35,77 +145,193 @@ class RenderEngine:
                     files_to_render.append(os.path.join(root, file))
         return files_to_render
 
-    def render(self):
+    def render(self, update_kustomization=True):
         """
         Renders the templates and adds the service to the kustomization file.
+
+        Templates are read from the template directory, including its subdirectories, and
+        rendered in process on a thread pool, substituting environment variables like envsubst.
+        Every output is written atomically to the same relative path under the output directory.
+        The first rendering error is raised once every template has been tried.
+
+        The hash of each template and of the variables it references is kept in a render
+        manifest, along with the hash of the output written. An output whose inputs did not change
+        since the last render, and whose file still holds what was written, is neither rendered
+        nor written again. Outputs of templates that no longer exist are removed.
+
+        Args:
+            update_kustomization (bool): Adds the service to the kustomization file. Callers
+                rendering several services concurrently add them all at once instead with
+                add_services_to_kustomization.
+
+        Returns:
+            list[str]: The outputs whose content changed or that were removed, relative to the
+                output path.
         """
         files_to_render = self.__retrieve_files_to_render()
-        for file in files_to_render:
-            print(f"Rendering {file}")
-            self.__run_command(f"envsubst < {file} > {file[:-5]}")
+        variables = dict(os.environ) if self.variables is None else self.variables
+        manifest = self.__read_manifest()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.__render_file, file, variables, manifest) for file in files_to_render]
+
+        results = [future.result() for future in futures]
+        digests = {output: entry for output, entry, _, _ in results}
+        removed = sorted(output for output in manifest if output not in digests)
+        changed = sorted([output for output, _, output_changed, _ in results if output_changed] + removed)
+
+        if self.dry_run:
+            for _, _, _, diff in results:
+                print(diff, end="")
+            for output in removed:
+                print(_diff(os.path.join(self.output_path, output), output, ""), end="")
+            return changed
+
+        for output in removed:
+            print(f"Removing {output}")
+            try:
+                os.remove(os.path.join(self.output_path, output))
+            except FileNotFoundError:
+                pass
+
+        if digests != manifest:
+            self.__write_manifest(digests)
 
-            if self.remove_template_file:
-                os.remove(file)
+        if update_kustomization:
+            self.__add_service_to_kustomization_resources()
 
-        self.__add_service_to_kustomization_resources()
+        return changed
 
-    def __run_command(self, command):
+    def __render_file(self, file, variables, manifest):
         """
-        Runs a shell command.
+        Renders a single template to the output directory, without its .tmpl extension.
 
         Args:
-            command (str): The command to run.
+            file (str): The path of the template.
+            variables (dict): The variable values by name.
+            manifest (dict): The input and output hashes of the last render by output.
 
         Returns:
-            The output of the command.
+            An (output, manifest entry, changed, diff) tuple, with the output's path relative to the
+            output directory and whether its content changed. The diff against the current output
+            is only computed in dry-run mode.
         """
+        template = load_template(file)
+        output = os.path.relpath(file[:-5], self.path)
+        output_path = os.path.join(self.output_path, output)
+        digest = template.input_digest(variables)
+        previous = manifest.get(output, {})
+        current = _file_digest(output_path)
+
+        if previous.get("input") == digest and previous.get("output") == current:
+            print(f"Unchanged {file}")
+            return output, previous, False, ""
+
+        print(f"Rendering {file}")
+        rendered = template.render(variables, self.strict, file)
+        entry = {"input": digest, "output": hashlib.sha256(rendered.encode("utf-8")).hexdigest()}
+
+        if self.dry_run:
+            return output, entry, entry["output"] != current, _diff(output_path, output, rendered)
+
+        if entry["output"] != current:
+            _write_atomic(output_path, rendered)
+
+        return output, entry, entry["output"] != current, ""
+
+    def __read_manifest(self):
         try:
-            output = subprocess.check_output(command, stderr=subprocess.STDOUT, \
-                                             universal_newlines=True, shell=True)
-            return output.strip()
-        except subprocess.CalledProcessError as ex:
-            print(f"Error: {ex.output}")
-            return None
+            with open(self.manifest_path, "r", encoding="utf-8") as r_stream:
+                manifest = json.load(r_stream)
+        except (OSError, ValueError):
+            return {}
+
+        return {output: entry for output, entry in manifest.items() if isinstance(entry, dict)}
+
+    def __write_manifest(self, digests):
+        _write_atomic(self.manifest_path, json.dumps(digests, indent=2, sort_keys=True) + "\n")
 
     def __add_service_to_kustomization_resources(self):
         """
         Adds the service to the kustomization file.
         """
-        # verify that the kustomization file exists
-        if not os.path.exists(self.kustomization_path):
-            raise ValueError(
-                f"The kustomization file {self.kustomization_path} does not exist."
-            )
+        add_services_to_kustomization(self.kustomization_path, [self.service_name])
 
-        with open(self.kustomization_path, "r", encoding="utf-8") as r_stream:
-            yaml_dict = yaml.safe_load(r_stream)
-            # check if the resources key exists
 
-            if "resources" not in yaml_dict:
-                raise ValueError("No resources found in kustomization yaml file.")
+def add_services_to_kustomization(kustomization_path, service_names):
+    """
+    Adds services to the resources of a kustomization file in a single update.
 
-            # Check if the service already exists in the resources
-            if f"./services/{self.service_name}" not in yaml_dict["resources"]:
-                yaml_dict["resources"].append(f"./services/{self.service_name}")
-                # Write the updated yaml to the kustomization file\
-                with open(self.kustomization_path, "w", encoding="utf-8") as w_stream:
-                    print(f"Adding {self.service_name} to {self.kustomization_path}")
-                    yaml.safe_dump(yaml_dict, w_stream, default_flow_style=False, sort_keys=False)
+    Args:
+        kustomization_path (str): The path to the kustomization file.
+        service_names (list[str]): The names of the services to add.
 
-    def __run_command(self, command):
-        """
-        Runs a shell command.
+    Returns:
+        list[str]: The names of the services that were added.
+    """
+    # verify that the kustomization file exists
+    if not os.path.exists(kustomization_path):
+        raise ValueError(
+            f"The kustomization file {kustomization_path} does not exist."
+        )
 
-        Args:
-            command (str): The command to run.
+    with open(kustomization_path, "r", encoding="utf-8") as r_stream:
+        yaml_dict = yaml.safe_load(r_stream)
 
-        Returns:
-            The output of the command.
-        """
-        try:
-            output = subprocess.check_output(command, stderr=subprocess.STDOUT, \
-                                             universal_newlines=True, shell=True)
-            return output.strip()
-        except subprocess.CalledProcessError as ex:
-            print(f"Error: {ex.output}")
-            return None
+    # check if the resources key exists
+    if "resources" not in yaml_dict:
+        raise ValueError("No resources found in kustomization yaml file.")
+
+    # Skip the services that already exist in the resources
+    added = [name for name in dict.fromkeys(service_names) if f"./services/{name}" not in yaml_dict["resources"]]
+    if added:
+        yaml_dict["resources"].extend(f"./services/{name}" for name in added)
+        print(f"Adding {', '.join(added)} to {kustomization_path}")
+        # Write the updated yaml to the kustomization file
+        _write_atomic(kustomization_path, yaml.safe_dump(yaml_dict, default_flow_style=False, sort_keys=False))
+
+    return added
+
+
+def _write_atomic(path, text):
+    """
+    Writes a file through a temporary file in the same directory, so readers never see it
+    partially written. Missing parent directories are created.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as w_stream:
+            w_stream.write(text)
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def _file_digest(path):
+    """
+    Returns the SHA-256 hash of a file's content, or None if it does not exist.
+    """
+    try:
+        with open(path, "rb") as r_stream:
+            return hashlib.sha256(r_stream.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def _diff(output_path, output, rendered):
+    """
+    Returns the unified diff between an output file and its newly rendered content.
+    """
+    try:
+        with open(output_path, "r", encoding="utf-8", newline="") as r_stream:
+            current = r_stream.read()
+    except FileNotFoundError:
+        current = ""
+
+    return "".join(difflib.unified_diff(
+        current.splitlines(keepends=True), rendered.splitlines(keepends=True), f"a/{output}", f"b/{output}"
+    ))
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+from flask import Blueprint, Flask
+
+from src.api.admission import AdmissionController, queued_seconds
+
+
+def create_test_app(controller, release):
+    flask = Flask(__name__)
+    bp = Blueprint("names", __name__)
+
+    @bp.route("/slow")
+    def slow():
+        release.wait(5)
+        return "ok"
+
+    @flask.route("/healthz")
+    def healthz():
+        return "ok"
+
+    flask.register_blueprint(bp)
+    controller.register(flask, [bp.name])
+    return flask
+
+
+def test_excess_requests_are_shed_with_retry_after():
+    controller = AdmissionController(max_in_flight=1, max_queue_wait=0.01, retry_after=2)
+    release = threading.Event()
+    flask = create_test_app(controller, release)
+
+    first = threading.Thread(target=lambda: flask.test_client().get("/slow").close())
+    first.start()
+    while controller.in_flight == 0:
+        pass
+
+    response = flask.test_client().get("/slow")
+    response.close()
+    release.set()
+    first.join()
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+    assert controller.shed == 1
+    assert controller.in_flight == 0
+
+
+def test_requests_outside_the_protected_blueprints_are_not_counted():
+    controller = AdmissionController(max_in_flight=1, max_queue_wait=0.01)
+    release = threading.Event()
+    release.set()
+    flask = create_test_app(controller, release)
+
+    with flask.test_client().get("/healthz") as response:
+        assert response.status_code == 200
+
+    with flask.test_client().get("/slow") as response:
+        assert response.status_code == 200
+
+    assert controller.in_flight == 0
+    assert controller.shed == 0
+
+
+def test_slots_are_released_without_closing_responses():
+    controller = AdmissionController(max_in_flight=2, max_queue_wait=0.01)
+    release = threading.Event()
+    release.set()
+    flask = create_test_app(controller, release)
+    client = flask.test_client()
+
+    statuses = [client.get("/slow").status_code for _ in range(10)]
+
+    assert statuses == [200] * 10
+    assert controller.in_flight == 0
+    assert controller.shed == 0
+
+
+def test_streamed_responses_hold_their_slot_until_closed():
+    controller = AdmissionController(max_in_flight=1, max_queue_wait=0.01)
+    flask = Flask(__name__)
+    bp = Blueprint("names", __name__)
+
+    @bp.route("/stream")
+    def stream():
+        return flask.response_class(iter(["a", "b"]))
+
+    flask.register_blueprint(bp)
+    controller.register(flask, [bp.name])
+    client = flask.test_client()
+
+    response = client.get("/stream", buffered=False)
+    assert controller.in_flight == 1
+    assert client.get("/stream").status_code == 503
+
+    response.close()
+    response.close()
+
+    assert controller.in_flight == 0
+    assert client.get("/stream").data == b"ab"
+    assert controller.in_flight == 0
+
+
+def test_requests_queued_too_long_before_reaching_the_app_are_shed():
+    controller = AdmissionController(max_in_flight=2, max_queue_wait=0.1)
+    release = threading.Event()
+    release.set()
+    client = create_test_app(controller, release).test_client()
+
+    stale = client.get("/slow", headers={"X-Request-Start": f"t={time.time() - 0.5:.6f}"})
+    fresh = client.get("/slow", headers={"X-Request-Start": f"t={time.time():.6f}"})
+
+    assert stale.status_code == 503
+    assert fresh.status_code == 200
+    assert controller.shed == 1
+    assert controller.in_flight == 0
+
+
+@pytest.mark.parametrize("value", ["t=1700000000.5", "1700000000500", "t=1700000000500000"])
+def test_queued_seconds_accepts_seconds_milliseconds_and_microseconds(value):
+    assert queued_seconds(value, now=1700000001.0) == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize("value", [None, "", "t=soon"])
+def test_queued_seconds_ignores_missing_or_invalid_values(value):
+    assert queued_seconds(value) is None
@@ -1,6 +1,13 @@
+import json
+import multiprocessing
 import random
 
-from src.api import create_app
+import pytest
+
+from src.api import create_app, warm_up
+from src.api.app import name_pool
+from src.api.names import generate_names, iter_name_chunks, name_for_id
+from src.api.pool import NamePool
 
 app = create_app()
 
@@ -9,3 +16,194 @@ def test_generate_name():
     random.seed(1)
     response = app.test_client().get("/")
     assert response.status_code == 200
+
+
+def test_name_pool_refills_below_low_water():
+    pool = NamePool(size=8, refill_batch=4, low_water=4)
+    pool.ensure_started = lambda: None
+    pool.fill()
+    assert len(pool) == 8
+
+    for _ in range(4):
+        assert pool.pop()
+    assert not pool._refill_needed.is_set()
+
+    assert pool.pop()
+    assert pool._refill_needed.is_set()
+    assert pool.misses == 0
+
+
+def test_name_pool_falls_back_to_inline_generation():
+    pool = NamePool(size=2, refill_batch=1, generator=lambda: "inline-name")
+    pool.ensure_started = lambda: None
+
+    assert pool.pop() == "inline-name"
+    assert pool.misses == 1
+
+
+def _draw_in_child(pool, output):
+    with open(output, "w", encoding="utf-8") as w_stream:
+        w_stream.write("\n".join(generate_names(50) + [pool.pop()]))
+
+
+def test_forked_workers_draw_different_names(tmp_path):
+    pool = NamePool(size=4, refill_batch=4)
+    pool.fill()
+    outputs = [str(tmp_path / f"names-{i}") for i in range(2)]
+    workers = [
+        multiprocessing.get_context("fork").Process(target=_draw_in_child, args=(pool, output)) for output in outputs
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    drawn = []
+    for output in outputs:
+        with open(output, "r", encoding="utf-8") as r_stream:
+            drawn.append(r_stream.read().splitlines())
+
+    assert drawn[0][:50] != drawn[1][:50]
+    # Names pooled before the fork are discarded rather than handed out by every worker
+    assert drawn[0][50] not in pool._names
+    assert drawn[1][50] not in pool._names
+
+
+def test_name_pool_rejects_invalid_size():
+    with pytest.raises(ValueError):
+        NamePool(size=0)
+
+
+def test_generate_names_batch():
+    response = app.test_client().get("/names?count=50")
+    assert response.status_code == 200
+    assert len(response.get_json()["names"]) == 50
+
+
+def test_generate_names_batch_is_reproducible_with_seed():
+    first = app.test_client().get("/names?count=10&seed=42").get_json()["names"]
+    second = app.test_client().get("/names?count=10&seed=42").get_json()["names"]
+    assert first == second
+    assert all(name.count("-") >= 1 for name in first)
+
+
+@pytest.mark.parametrize("query", ["count=0", "count=abc", "count=10&seed=x", "count=100000000"])
+def test_generate_names_batch_rejects_invalid_arguments(query):
+    response = app.test_client().get(f"/names?{query}")
+    assert response.status_code == 400
+
+
+def test_stream_names_as_ndjson():
+    response = app.test_client().get("/names/stream?count=2500&seed=7")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 2500
+    assert json.loads(lines[0])["name"]
+
+
+def test_stream_names_negotiated_through_accept_header():
+    response = app.test_client().get("/names?count=3", headers={"Accept": "application/x-ndjson"})
+    assert response.mimetype == "application/x-ndjson"
+    assert len(response.get_data(as_text=True).splitlines()) == 3
+
+
+def test_stream_names_stops_when_closed():
+    chunks = iter_name_chunks(10_000_000, 1000)
+    assert len(next(chunks)) == 1000
+    chunks.close()
+
+    with pytest.raises(StopIteration):
+        next(chunks)
+
+
+def test_metrics_report_request_counts_and_latency():
+    app.test_client().get("/")
+    response = app.test_client().get("/metrics")
+
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert 'http_requests_total{route="/",method="GET",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{route="/",le="+Inf"}' in body
+    assert "name_pool_size" in body
+
+
+def test_warm_up_fills_the_name_pool():
+    warm_up(app)
+
+    assert len(name_pool) == name_pool.size
+    assert name_pool._pid is not None
+
+
+def test_health_probes_reflect_warm_up(monkeypatch):
+    monkeypatch.setattr("src.api.app.name_pool", NamePool(size=4, refill_batch=4))
+
+    assert app.test_client().get("/healthz").status_code == 200
+    response = app.test_client().get("/readyz")
+    assert response.status_code == 503
+    assert response.get_json()["checks"]["name_pool"] is False
+
+    warm_up(app)
+
+    response = app.test_client().get("/readyz")
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "ready"
+
+
+def test_health_probes_are_not_counted_in_request_metrics():
+    app.test_client().get("/healthz")
+
+    body = app.test_client().get("/metrics").get_data(as_text=True)
+    assert 'route="/healthz"' not in body
+
+
+@pytest.mark.parametrize("accept", ["", "application/json", "*/*"])
+def test_generate_names_defaults_to_json(accept):
+    response = app.test_client().get("/names?count=3", headers={"Accept": accept})
+    assert response.mimetype == "application/json"
+    assert len(response.get_json()["names"]) == 3
+    assert "Accept" in response.vary
+
+
+def test_generate_names_as_plain_text():
+    response = app.test_client().get("/names?count=3&seed=7", headers={"Accept": "text/plain"})
+    json_names = app.test_client().get("/names?count=3&seed=7").get_json()["names"]
+
+    assert response.mimetype == "text/plain"
+    assert response.get_data(as_text=True).splitlines() == json_names
+
+
+def test_generate_name_as_msgpack():
+    msgpack = pytest.importorskip("msgpack")
+
+    response = app.test_client().get("/", headers={"Accept": "application/msgpack"})
+    assert response.mimetype == "application/msgpack"
+    assert msgpack.unpackb(response.get_data())["name"]
+
+
+def test_name_by_id_is_deterministic():
+    first = app.test_client().get("/names/by-id/order-1234").get_json()["name"]
+    second = app.test_client().get("/names/by-id/order-1234").get_json()["name"]
+
+    assert first == second == name_for_id("order-1234")
+    assert first != name_for_id("order-1235")
+
+
+def test_name_for_id_mapping_is_pinned():
+    # The mapping is part of the API contract, so changes to the word arrays must not move it
+    assert name_for_id("order-1234") == "tough-customer"
+
+
+def test_names_by_id_in_bulk():
+    ids = [f"user-{i}" for i in range(2000)] + [42]
+    response = app.test_client().post("/names/by-id", json={"ids": ids})
+
+    assert response.status_code == 200
+    assert response.get_json()["names"] == [name_for_id(str(key)) for key in ids]
+
+
+@pytest.mark.parametrize("body", [b"not json", b'{"ids": "a"}', b'{"ids": [true]}', b'{"ids": []}', b"[]"])
+def test_names_by_id_rejects_invalid_bodies(body):
+    response = app.test_client().post("/names/by-id", data=body, content_type="application/json")
+    assert response.status_code == 400
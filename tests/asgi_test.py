@@ -0,0 +1,81 @@
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.api import create_asgi_app, warm_up
+
+client = TestClient(create_asgi_app())
+
+
+def test_generate_name():
+    response = client.get("/")
+    assert response.status_code == 200
+    assert response.json()["name"]
+
+
+def test_generate_names_batch_is_reproducible_with_seed():
+    first = client.get("/names?count=10&seed=42").json()["names"]
+    second = client.get("/names?count=10&seed=42").json()["names"]
+    assert len(first) == 10
+    assert first == second
+
+
+@pytest.mark.parametrize("query", ["count=0", "count=abc", "count=10&seed=x"])
+def test_generate_names_batch_rejects_invalid_arguments(query):
+    response = client.get(f"/names?{query}")
+    assert response.status_code == 400
+    assert "error" in response.json()
+
+
+def test_stream_names_as_ndjson():
+    response = client.get("/names/stream?count=1500")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = response.text.splitlines()
+    assert len(lines) == 1500
+    assert json.loads(lines[-1])["name"]
+
+
+def test_stream_names_negotiated_through_accept_header():
+    response = client.get("/names?count=3", headers={"Accept": "application/x-ndjson"})
+    assert len(response.text.splitlines()) == 3
+
+
+def test_metrics_report_request_counts():
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_requests_total{route="/",method="GET",status="200"}' in response.text
+
+
+def test_health_probes():
+    warm_up(client.app)
+
+    assert client.get("/healthz").status_code == 200
+    assert client.get("/readyz").json()["checks"]["telemetry_exporter"] is True
+
+
+def test_generate_names_as_plain_text():
+    response = client.get("/names?count=3&seed=7", headers={"Accept": "text/plain"})
+    json_names = client.get("/names?count=3&seed=7").json()["names"]
+
+    assert response.headers["content-type"] == "text/plain; charset=utf-8"
+    assert response.text.splitlines() == json_names
+
+
+def test_names_by_id():
+    single = client.get("/names/by-id/order-1234").json()["name"]
+    bulk = client.post("/names/by-id", json={"ids": ["order-1234", 7]}).json()["names"]
+
+    assert bulk[0] == single
+    assert client.post("/names/by-id", content=b"[]").status_code == 400
+
+
+def test_requests_queued_too_long_before_reaching_the_app_are_shed():
+    response = client.get("/", headers={"X-Request-Start": f"t={time.time() - 60:.6f}"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
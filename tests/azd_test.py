@@ -0,0 +1,54 @@
+import os
+
+from src.hooks.wrappers.azd import AzdEnvironment, format_dotenv, parse_dotenv
+
+
+def test_parse_dotenv_handles_quoting_and_equals_signs():
+    values = parse_dotenv(
+        '# comment\n'
+        'AZURE_ENV_NAME="dev"\n'
+        'CONNECTION_STRING="InstrumentationKey=abc;IngestionEndpoint=https://x/"\n'
+        "LITERAL='a \\n b'\n"
+        'ESCAPED="say \\"hi\\"\\nnext \\$HOME"\n'
+        'export BARE=value=with=equals # trailing comment\n'
+        'EMPTY=\n'
+    )
+
+    assert values == {
+        "AZURE_ENV_NAME": "dev",
+        "CONNECTION_STRING": "InstrumentationKey=abc;IngestionEndpoint=https://x/",
+        "LITERAL": "a \\n b",
+        "ESCAPED": 'say "hi"\nnext $HOME',
+        "BARE": "value=with=equals",
+        "EMPTY": "",
+    }
+
+
+def test_format_dotenv_round_trips():
+    values = {"B": 'quote " and \\ and $VAR', "A": "line\nbreak", "C": "a=b"}
+
+    assert parse_dotenv(format_dotenv(values)) == values
+    assert format_dotenv(values).startswith('A="line\\nbreak"\n')
+
+
+def test_update_writes_changed_values_once(tmp_path):
+    (tmp_path / ".env").write_text('AZURE_ENV_NAME="dev"\nAZURE_LOCATION="eastus"\n', encoding="utf-8")
+    environment = AzdEnvironment(str(tmp_path))
+
+    changed = environment.update({"AZURE_LOCATION": "eastus", "GITOPS_REPO": "org/repo"})
+
+    assert changed == ["GITOPS_REPO"]
+    assert AzdEnvironment(str(tmp_path)).values() == {
+        "AZURE_ENV_NAME": "dev", "AZURE_LOCATION": "eastus", "GITOPS_REPO": "org/repo"
+    }
+    assert os.listdir(tmp_path) == [".env"]
+
+
+def test_update_skips_the_write_when_nothing_changed(tmp_path):
+    path = tmp_path / ".env"
+    path.write_text('AZURE_ENV_NAME="dev"\n', encoding="utf-8")
+    os.utime(path, ns=(0, 0))
+    environment = AzdEnvironment(str(tmp_path))
+
+    assert environment.update({"AZURE_ENV_NAME": "dev"}) == []
+    assert os.stat(path).st_mtime_ns == 0
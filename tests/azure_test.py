@@ -1,7 +1,12 @@
 import sys
+import threading
+import time
 from unittest.mock import MagicMock
 import pytest
-from src.hooks.wrappers.azure import AzureClient
+from azure.core.credentials import AccessToken
+from azure.core.exceptions import ResourceNotFoundError
+from azure.mgmt.containerservice.models import ManagedCluster
+from src.hooks.wrappers.azure import AzureClient, CachingCredential, DiscoveryCache
 
 
 @pytest.fixture
@@ -32,6 +37,167 @@ def test_get_aks_clusters(azure_client):
     assert len(azure_client.get_aks_clusters("subscription_id")) == 2
 
 
+def test_get_keyvault_stops_at_the_first_tagged_vault_of_the_resource_group(azure_client):
+    def vaults():
+        yield MagicMock(tags=None)
+        yield MagicMock(tags={"azd-env-name": "other_env"})
+        yield MagicMock(tags={"azd-env-name": "test_env"}, name="kv")
+        raise AssertionError("listed past the first match")
+
+    kv_client = MagicMock()
+    kv_client.vaults.list_by_resource_group.return_value = vaults()
+    azure_client._get_client = MagicMock(return_value=kv_client)
+
+    keyvault = azure_client.get_keyvault("test_env", "subscription_id", "rg")
+
+    assert keyvault.tags == {"azd-env-name": "test_env"}
+    kv_client.vaults.list_by_resource_group.assert_called_once_with("rg")
+    kv_client.vaults.get.assert_not_called()
+
+
+def test_get_keyvault_reads_a_known_vault_without_listing(azure_client):
+    kv_client = MagicMock()
+    kv_client.vaults.get.return_value.tags = {"azd-env-name": "test_env"}
+    azure_client._get_client = MagicMock(return_value=kv_client)
+
+    assert azure_client.get_keyvault("test_env", "subscription_id", "rg", "kv") == kv_client.vaults.get.return_value
+    kv_client.vaults.get.assert_called_once_with("rg", "kv")
+    kv_client.vaults.list_by_resource_group.assert_not_called()
+
+
+def test_get_keyvault_lists_vaults_when_a_known_vault_belongs_to_another_environment(azure_client):
+    kv_client = MagicMock()
+    kv_client.vaults.get.return_value.tags = {"azd-env-name": "other_env"}
+    kv_client.vaults.list_by_resource_group.return_value = [MagicMock(tags={"azd-env-name": "test_env"})]
+    azure_client._get_client = MagicMock(return_value=kv_client)
+
+    keyvault = azure_client.get_keyvault("test_env", "subscription_id", "rg", "kv")
+
+    assert keyvault is kv_client.vaults.list_by_resource_group.return_value[0]
+
+
+def test_get_container_registry_lists_registries_when_a_known_registry_is_missing(azure_client):
+    registry_client = MagicMock()
+    registry_client.registries.get.side_effect = ResourceNotFoundError("not found")
+    registry_client.registries.list_by_resource_group.return_value = [
+        MagicMock(tags={"azd-env-name": "other_env"}),
+        MagicMock(tags={"azd-env-name": "test_env"}),
+    ]
+    azure_client._get_client = MagicMock(return_value=registry_client)
+
+    registry = azure_client.get_container_registry("subscription_id", "rg", "acr", "test_env")
+
+    assert registry is registry_client.registries.list_by_resource_group.return_value[1]
+
+
+def test_management_clients_are_reused(azure_client):
+    client_class = MagicMock()
+
+    first = azure_client._get_client(client_class, "subscription_id")
+    second = azure_client._get_client(client_class, "subscription_id")
+
+    assert first is second
+    client_class.assert_called_once()
+    assert client_class.call_args.args == (azure_client._credential, "subscription_id")
+
+
+def test_caching_credential_shares_tokens_until_they_expire():
+    credential = MagicMock()
+    credential.get_token.side_effect = [
+        AccessToken("first", int(time.time()) + 3600),
+        AccessToken("second", int(time.time()) + 3600),
+    ]
+    caching_credential = CachingCredential(credential)
+
+    assert caching_credential.get_token("scope").token == "first"
+    assert caching_credential.get_token("scope").token == "first"
+    assert caching_credential.get_token("other-scope").token == "second"
+    assert credential.get_token.call_count == 2
+
+
+def test_get_environment_resources_fetches_concurrently(azure_client):
+    # Both lookups only return once the other one has started
+    barrier = threading.Barrier(2, timeout=5)
+
+    def get_keyvault(*_):
+        barrier.wait()
+        return "keyvault"
+
+    def get_container_registry(*_):
+        barrier.wait()
+        return "registry"
+
+    azure_client.get_keyvault = get_keyvault
+    azure_client.get_container_registry = get_container_registry
+
+    assert azure_client.get_environment_resources("env", "subscription_id", "rg") == ("keyvault", "registry")
+
+
+def test_discovery_cache_expires_entries(tmp_path):
+    cache = DiscoveryCache(str(tmp_path / "cache.json"))
+    cache.set("subscription", "subscription_id")
+
+    assert DiscoveryCache(cache.path).get("subscription", 60) == "subscription_id"
+    assert DiscoveryCache(cache.path).get("subscription", -1) is None
+
+
+def test_cached_lookups_skip_arm_on_the_next_run(tmp_path):
+    cluster = ManagedCluster({"id": "/subscriptions/s/resourceGroups/rg/c", "name": "c", "location": "eastus",
+                              "tags": {"azd-env-name": "test_env"}})
+    first_run = AzureClient(str(tmp_path))
+    first_run.get_container_service_client = MagicMock()
+    first_run.get_container_service_client.return_value.managed_clusters.list.return_value = [cluster]
+    assert first_run.get_aks_clusters("subscription_id")[0].name == "c"
+
+    next_run = AzureClient(str(tmp_path))
+    next_run.get_container_service_client = MagicMock()
+    clusters = next_run.get_aks_clusters("subscription_id")
+
+    assert clusters[0].name == "c"
+    assert clusters[0].tags == {"azd-env-name": "test_env"}
+    next_run.get_container_service_client.assert_not_called()
+
+    refreshed_run = AzureClient(str(tmp_path), refresh=True)
+    refreshed_run.get_container_service_client = MagicMock()
+    refreshed_run.get_aks_clusters("subscription_id")
+    refreshed_run.get_container_service_client.assert_called_once()
+
+
+def test_secrets_are_cached_in_memory_only(tmp_path, monkeypatch):
+    secret_client = MagicMock()
+    secret_client.return_value.get_secret.return_value.value = "pat"
+    monkeypatch.setattr("src.hooks.wrappers.azure.SecretClient", secret_client)
+    azure_client = AzureClient(str(tmp_path))
+    keyvault = MagicMock()
+
+    assert azure_client.get_keyvault_secret(keyvault, "githubToken") == "pat"
+    assert azure_client.get_keyvault_secret(keyvault, "githubToken") == "pat"
+
+    secret_client.return_value.get_secret.assert_called_once_with("githubToken")
+    assert not (tmp_path / "discovery-cache.json").exists()
+
+
+def test_active_subscription_is_not_cached(tmp_path, monkeypatch):
+    subscription_client = MagicMock()
+    subscription_client.return_value.subscriptions.list.side_effect = [
+        iter([MagicMock(subscription_id="first")]),
+        iter([MagicMock(subscription_id="second")]),
+    ]
+    monkeypatch.setattr("src.hooks.wrappers.azure.SubscriptionClient", subscription_client)
+
+    assert AzureClient(str(tmp_path)).get_active_subscription_id() == "first"
+    assert AzureClient(str(tmp_path)).get_active_subscription_id() == "second"
+
+
+def test_set_azd_env_variables_writes_the_environment_file(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.hooks.wrappers.azd.subprocess.check_output", MagicMock(side_effect=AssertionError))
+    azure_client = AzureClient(str(tmp_path))
+
+    azure_client.set_azd_env_variables({"AZURE_RESOURCE_GROUP": "rg", "GITOPS_REPO": "org/repo"})
+
+    assert (tmp_path / ".env").read_text(encoding="utf-8") == 'AZURE_RESOURCE_GROUP="rg"\nGITOPS_REPO="org/repo"\n'
+
+
 def test_get_gitops_repo_pat_token(azure_client):
     subscription_id = azure_client.get_active_subscription_id()
     clusters = azure_client.get_aks_clusters(subscription_id)
@@ -0,0 +1,122 @@
+import os
+import subprocess
+import tempfile
+import pytest
+from src.hooks.wrappers.github import GitClient
+
+
+def _git(cwd, *args):
+    return subprocess.check_output(["git", *args], cwd=cwd, universal_newlines=True).strip()
+
+
+def _commit_to_origin(origin, files, message):
+    with tempfile.TemporaryDirectory() as work_dir:
+        _git(work_dir, "clone", "-q", origin, ".")
+        for path, content in files.items():
+            os.makedirs(os.path.dirname(os.path.join(work_dir, path)), exist_ok=True)
+            with open(os.path.join(work_dir, path), "w", encoding="utf-8") as w_stream:
+                w_stream.write(content)
+        _git(work_dir, "add", ".")
+        _git(work_dir, "-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "-qm", message)
+        _git(work_dir, "push", "-q", "origin", "HEAD:main")
+
+
+@pytest.fixture
+def origin(tmp_path):
+    origin_path = tmp_path / "owner" / "gitops.git"
+    origin_path.mkdir(parents=True)
+    _git(origin_path, "init", "-q", "--bare", "-b", "main")
+    _git(origin_path, "config", "uploadpack.allowFilter", "true")
+    _commit_to_origin(str(origin_path), {
+        "environments/dev/kustomization.yaml": "resources: []\n",
+        "environments/prod/kustomization.yaml": "resources: []\n",
+    }, "initial")
+    return origin_path
+
+
+@pytest.fixture
+def git_client(tmp_path, origin):
+    return GitClient("token", mirror_dir=str(tmp_path / "mirrors"), base_url=f"file://{tmp_path}")
+
+
+def test_clone_repo_checks_out_the_sparse_paths(git_client, tmp_path):
+    directory = str(tmp_path / "checkout")
+
+    git_client.clone_repo("owner/gitops.git", "main", directory, sparse_paths=["environments/dev"], depth=1)
+
+    assert os.path.exists(os.path.join(directory, "environments", "dev", "kustomization.yaml"))
+    assert not os.path.exists(os.path.join(directory, "environments", "prod"))
+    assert os.path.exists(os.path.join(git_client.mirror_path("owner/gitops.git"), "HEAD"))
+
+
+def test_clone_repo_fetches_new_commits_into_the_existing_mirror(git_client, origin, tmp_path):
+    git_client.clone_repo("owner/gitops.git", "main", str(tmp_path / "first"))
+    _commit_to_origin(str(origin), {"environments/dev/service.yaml": "kind: Service\n"}, "add service")
+
+    git_client.clone_repo("owner/gitops.git", "main", str(tmp_path / "second"))
+
+    assert os.path.exists(tmp_path / "second" / "environments" / "dev" / "service.yaml")
+    assert _git(tmp_path / "second", "rev-parse", "HEAD") == _git(origin, "rev-parse", "main")
+
+
+def test_push_changes_pushes_the_worktree_to_the_target_branch(git_client, origin, tmp_path):
+    directory = str(tmp_path / "checkout")
+    git_client.clone_repo("owner/gitops.git", "main", directory, sparse_paths=["environments/dev"])
+    with open(os.path.join(directory, "environments", "dev", "values.yaml"), "w", encoding="utf-8") as w_stream:
+        w_stream.write("image: api:1\n")
+
+    _git(directory, "config", "user.name", "test")
+    _git(directory, "config", "user.email", "test@example.com")
+    git_client.push_changes(directory, "Deployed service: api")
+
+    assert _git(origin, "log", "-1", "--format=%s", "main") == "Deployed service: api"
+    assert _git(origin, "show", "main:environments/prod/kustomization.yaml") == "resources: []"
+
+
+def _write(directory, path, content):
+    with open(os.path.join(directory, path), "w", encoding="utf-8") as w_stream:
+        w_stream.write(content)
+
+
+def _clone_for_commits(git_client, tmp_path):
+    directory = str(tmp_path / "checkout")
+    git_client.clone_repo("owner/gitops.git", "main", directory, sparse_paths=["environments/dev"])
+    _git(directory, "config", "user.name", "test")
+    _git(directory, "config", "user.email", "test@example.com")
+    return directory
+
+
+def test_commit_and_push_skips_deployments_without_changes(git_client, origin, tmp_path):
+    directory = _clone_for_commits(git_client, tmp_path)
+    head = _git(origin, "rev-parse", "main")
+
+    assert git_client.commit_and_push(directory, "Deployed services: api") is False
+
+    assert _git(origin, "rev-parse", "main") == head
+
+
+def test_commit_and_push_commits_all_services_at_once(git_client, origin, tmp_path):
+    directory = _clone_for_commits(git_client, tmp_path)
+    head = _git(origin, "rev-parse", "main")
+    _write(directory, "environments/dev/api.yaml", "kind: Deployment\n")
+    _write(directory, "environments/dev/worker.yaml", "kind: Deployment\n")
+    os.remove(os.path.join(directory, "environments", "dev", "kustomization.yaml"))
+
+    assert git_client.commit_and_push(directory, "Deployed services: api, worker") is True
+
+    assert _git(origin, "rev-parse", "main~1") == head
+    assert _git(origin, "diff", "--name-status", "main~1", "main").splitlines() == [
+        "A\tenvironments/dev/api.yaml",
+        "D\tenvironments/dev/kustomization.yaml",
+        "A\tenvironments/dev/worker.yaml",
+    ]
+
+
+def test_commit_and_push_rebases_when_the_branch_moved_on(git_client, origin, tmp_path):
+    directory = _clone_for_commits(git_client, tmp_path)
+    _commit_to_origin(str(origin), {"environments/prod/api.yaml": "kind: Deployment\n"}, "deploy prod")
+    _write(directory, "environments/dev/api.yaml", "kind: Deployment\n")
+
+    assert git_client.commit_and_push(directory, "Deployed services: api") is True
+
+    assert _git(origin, "log", "--format=%s", "main").splitlines() == ["Deployed services: api", "deploy prod", "initial"]
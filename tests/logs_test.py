@@ -0,0 +1,61 @@
+import io
+import logging
+import threading
+
+from src.api.logs import DroppingQueueHandler
+
+
+def _logger(handler):
+    logger = logging.getLogger(f"logs_test.{id(handler)}")
+    logger.propagate = False
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def test_records_are_formatted_and_written_by_the_listener():
+    stream = io.StringIO()
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    handler = DroppingQueueHandler(stream_handler)
+
+    _logger(handler).info("Random Name Selected: - %s", "quiet-otter")
+    handler.close()
+
+    assert stream.getvalue() == "INFO Random Name Selected: - quiet-otter\n"
+
+
+def test_records_are_dropped_when_the_queue_is_full():
+    handler = DroppingQueueHandler(logging.NullHandler(), capacity=2)
+    handler.ensure_started()
+    handler._listener.stop()
+    handler._listener = None
+
+    logger = _logger(handler)
+    for i in range(5):
+        logger.info("record %d", i)
+
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_close_drops_a_record_when_the_queue_is_full():
+    writing = threading.Event()
+    unblock = threading.Event()
+
+    class SlowHandler(logging.Handler):
+        def emit(self, record):
+            writing.set()
+            unblock.wait(5)
+
+    handler = DroppingQueueHandler(SlowHandler(), capacity=1)
+    logger = _logger(handler)
+    logger.info("written")
+    writing.wait(5)
+    logger.info("queued")
+    logger.info("dropped")
+
+    threading.Timer(0.1, unblock.set).start()
+    handler.close()
+
+    assert handler.dropped == 2
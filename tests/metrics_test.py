@@ -0,0 +1,68 @@
+import os
+import threading
+
+from src.api.metrics import MetricsRegistry
+
+
+def test_counters_from_every_thread_are_summed():
+    registry = MetricsRegistry()
+    inc = registry.counter("requests_total", "Requests.")
+
+    threads = [threading.Thread(target=lambda: [inc(route="/") for _ in range(100)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert 'requests_total{route="/"} 400' in registry.collect()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    observe = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    observe(0.05)
+    observe(0.5)
+    observe(5.0)
+
+    body = registry.collect()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in body
+    assert 'latency_seconds_bucket{le="1.0"} 2' in body
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in body
+    assert "latency_seconds_count 3" in body
+
+
+def test_snapshots_are_aggregated_across_processes(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path))
+    inc = registry.counter("requests_total", "Requests.")
+    registry.gauge("pool_size", "Pool size.", lambda: 5)
+    inc(route="/")
+
+    # A snapshot left behind by a worker that has since exited
+    dead_pid = 2**22 + 1
+    (tmp_path / f"metrics-{dead_pid}.json").write_text(
+        '{"pid": %d, "values": [["requests_total", [["route", "/"]], 2]], "gauges": [["pool_size", [], 7]]}'
+        % dead_pid
+    )
+
+    body = registry.collect()
+    assert 'requests_total{route="/"} 3' in body
+    assert "pool_size 5" in body
+    assert len(list(tmp_path.glob(f"metrics-{os.getpid()}-*.json"))) == 1
+
+
+def test_restarted_worker_reusing_a_pid_keeps_the_counters_of_the_previous_one(tmp_path):
+    # Two registries in one process stand in for a worker and its replacement with the same pid
+    previous = MetricsRegistry(directory=str(tmp_path))
+    previous.counter("requests_total", "Requests.")(2, route="/")
+    previous.gauge("pool_size", "Pool size.", lambda: 7)
+    previous.flush()
+
+    restarted = MetricsRegistry(directory=str(tmp_path))
+    inc = restarted.counter("requests_total", "Requests.")
+    restarted.gauge("pool_size", "Pool size.", lambda: 5)
+    inc(route="/")
+
+    body = restarted.collect()
+    assert 'requests_total{route="/"} 3' in body
+    assert "pool_size 5" in body
+    assert len(list(tmp_path.glob(f"metrics-{os.getpid()}-*.json"))) == 2
@@ -3,7 +3,7 @@ import pytest
 import shutil
 import tempfile
 import yaml
-from src.hooks.wrappers.renderer import RenderEngine
+from src.hooks.wrappers.renderer import RenderEngine, Template, UndefinedVariableError, add_services_to_kustomization
 
 @pytest.fixture
 def render_engine():
@@ -49,3 +49,141 @@ def test_render(render_engine):
         with open(test_file, "r", encoding="utf-8") as r_stream:
             yaml_dict = yaml.safe_load(r_stream)
             assert yaml_dict["image"]["repository"] == test_image_name
+
+def test_template_substitutes_like_envsubst():
+    template = Template("a: $FIRST\nb: ${SECOND}-x\nc: ${THIRD:-default} $ $1 $MISSING\n")
+
+    rendered = template.render({"FIRST": "1", "SECOND": "2", "THIRD": "3"})
+
+    assert rendered == "a: 1\nb: 2-x\nc: ${THIRD:-default} $ $1 \n"
+
+def test_render_fails_on_undefined_variables_in_strict_mode():
+    with tempfile.TemporaryDirectory() as test_dir:
+        template_path = os.path.join(test_dir, "values.yaml.tmpl")
+        with open(template_path, "w", encoding="utf-8") as w_stream:
+            w_stream.write("image: ${RENDER_TEST_UNDEFINED_IMAGE}\n")
+
+        client = RenderEngine(test_dir, os.path.join(test_dir, "kustomization.yaml"), "my-service", strict=True)
+
+        with pytest.raises(UndefinedVariableError) as exc_info:
+            client.render()
+
+        assert exc_info.value.names == {"RENDER_TEST_UNDEFINED_IMAGE"}
+        assert not os.path.exists(os.path.join(test_dir, "values.yaml"))
+
+def _write_templates(test_dir):
+    with open(os.path.join(test_dir, "kustomization.yaml"), "w", encoding="utf-8") as w_stream:
+        w_stream.write("resources: []\n")
+    with open(os.path.join(test_dir, "values.yaml.tmpl"), "w", encoding="utf-8") as w_stream:
+        w_stream.write("image: ${RENDER_TEST_IMAGE}\n")
+    with open(os.path.join(test_dir, "namespace.yaml.tmpl"), "w", encoding="utf-8") as w_stream:
+        w_stream.write("name: ${RENDER_TEST_NAMESPACE}\n")
+
+def test_render_skips_outputs_whose_inputs_did_not_change(monkeypatch):
+    monkeypatch.setenv("RENDER_TEST_IMAGE", "api:1")
+    monkeypatch.setenv("RENDER_TEST_NAMESPACE", "apps")
+
+    with tempfile.TemporaryDirectory() as test_dir:
+        _write_templates(test_dir)
+        client = RenderEngine(test_dir, os.path.join(test_dir, "kustomization.yaml"), "my-service")
+        assert client.render() == ["namespace.yaml", "values.yaml"]
+
+        monkeypatch.setenv("RENDER_TEST_IMAGE", "api:2")
+        _write_templates(test_dir)
+        assert client.render() == ["values.yaml"]
+
+        with open(os.path.join(test_dir, "values.yaml"), "r", encoding="utf-8") as r_stream:
+            assert r_stream.read() == "image: api:2\n"
+
+def test_render_dry_run_prints_the_diff_without_writing(monkeypatch, capsys):
+    monkeypatch.setenv("RENDER_TEST_IMAGE", "api:2")
+    monkeypatch.setenv("RENDER_TEST_NAMESPACE", "apps")
+
+    with tempfile.TemporaryDirectory() as test_dir:
+        _write_templates(test_dir)
+        with open(os.path.join(test_dir, "values.yaml"), "w", encoding="utf-8") as w_stream:
+            w_stream.write("image: api:1\n")
+        client = RenderEngine(test_dir, os.path.join(test_dir, "kustomization.yaml"), "my-service", dry_run=True)
+
+        assert client.render() == ["namespace.yaml", "values.yaml"]
+
+        output = capsys.readouterr().out
+        assert "-image: api:1\n+image: api:2\n" in output
+        assert "+name: apps\n" in output
+        assert sorted(os.listdir(test_dir)) == ["kustomization.yaml", "namespace.yaml.tmpl", "values.yaml",
+                                                "values.yaml.tmpl"]
+
+def test_render_writes_nested_outputs_to_the_output_path(monkeypatch):
+    monkeypatch.setenv("RENDER_TEST_IMAGE", "api:1")
+    monkeypatch.setenv("RENDER_TEST_NAMESPACE", "apps")
+
+    with tempfile.TemporaryDirectory() as source_dir, tempfile.TemporaryDirectory() as gitops_dir:
+        _write_templates(source_dir)
+        os.makedirs(os.path.join(source_dir, "overlays", "dev"))
+        shutil.move(os.path.join(source_dir, "namespace.yaml.tmpl"), os.path.join(source_dir, "overlays", "dev"))
+        kustomization_path = shutil.copy(os.path.join(source_dir, "kustomization.yaml"), gitops_dir)
+        output_path = os.path.join(gitops_dir, "services", "my-service")
+        client = RenderEngine(source_dir, kustomization_path, "my-service", output_path=output_path)
+
+        assert client.render() == [os.path.join("overlays", "dev", "namespace.yaml"), "values.yaml"]
+
+        with open(os.path.join(output_path, "overlays", "dev", "namespace.yaml"), "r", encoding="utf-8") as r_stream:
+            assert r_stream.read() == "name: apps\n"
+        assert os.path.exists(os.path.join(source_dir, "values.yaml.tmpl"))
+        assert not os.path.exists(os.path.join(source_dir, "values.yaml"))
+        assert sorted(os.listdir(output_path)) == [".render-manifest.json", "overlays", "values.yaml"]
+
+        os.remove(os.path.join(source_dir, "values.yaml.tmpl"))
+
+        assert client.render() == ["values.yaml"]
+        assert not os.path.exists(os.path.join(output_path, "values.yaml"))
+
+def test_render_uses_the_given_variables_instead_of_the_environment(monkeypatch):
+    monkeypatch.setenv("RENDER_TEST_IMAGE", "api:1")
+
+    with tempfile.TemporaryDirectory() as test_dir:
+        _write_templates(test_dir)
+        client = RenderEngine(test_dir, os.path.join(test_dir, "kustomization.yaml"), "my-service",
+                              variables={"RENDER_TEST_IMAGE": "worker:1", "RENDER_TEST_NAMESPACE": "jobs"})
+
+        client.render(update_kustomization=False)
+
+        with open(os.path.join(test_dir, "values.yaml"), "r", encoding="utf-8") as r_stream:
+            assert r_stream.read() == "image: worker:1\n"
+        with open(os.path.join(test_dir, "kustomization.yaml"), "r", encoding="utf-8") as r_stream:
+            assert yaml.safe_load(r_stream)["resources"] == []
+
+def test_add_services_to_kustomization_adds_missing_services_at_once():
+    with tempfile.TemporaryDirectory() as test_dir:
+        kustomization_path = os.path.join(test_dir, "kustomization.yaml")
+        with open(kustomization_path, "w", encoding="utf-8") as w_stream:
+            w_stream.write("resources:\n- ./services/api\n")
+
+        assert add_services_to_kustomization(kustomization_path, ["api", "worker", "web", "worker"]) == ["worker", "web"]
+
+        with open(kustomization_path, "r", encoding="utf-8") as r_stream:
+            assert yaml.safe_load(r_stream)["resources"] == ["./services/api", "./services/worker", "./services/web"]
+
+def test_render_keeps_the_manifest_outside_the_output_path(monkeypatch):
+    monkeypatch.setenv("RENDER_TEST_IMAGE", "api:1")
+    monkeypatch.setenv("RENDER_TEST_NAMESPACE", "apps")
+
+    with tempfile.TemporaryDirectory() as source_dir, tempfile.TemporaryDirectory() as gitops_dir, \
+            tempfile.TemporaryDirectory() as env_dir:
+        _write_templates(source_dir)
+        manifest_path = os.path.join(env_dir, "render-manifests", "my-service.json")
+        client = RenderEngine(source_dir, os.path.join(source_dir, "kustomization.yaml"), "my-service",
+                              output_path=gitops_dir, manifest_path=manifest_path)
+
+        assert client.render(update_kustomization=False) == ["namespace.yaml", "values.yaml"]
+        assert sorted(os.listdir(gitops_dir)) == ["namespace.yaml", "values.yaml"]
+        assert os.path.exists(manifest_path)
+
+        # An output changed in the repository since the last render is rendered again
+        with open(os.path.join(gitops_dir, "values.yaml"), "w", encoding="utf-8") as w_stream:
+            w_stream.write("image: edited\n")
+
+        assert client.render(update_kustomization=False) == ["values.yaml"]
+        assert client.render(update_kustomization=False) == []
+        with open(os.path.join(gitops_dir, "values.yaml"), "r", encoding="utf-8") as r_stream:
+            assert r_stream.read() == "image: api:1\n"
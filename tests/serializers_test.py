@@ -0,0 +1,17 @@
+import json
+
+from src.api import serializers
+
+
+def test_json_serializer_falls_back_to_the_standard_library(monkeypatch):
+    body = {"names": ["brave-otter", "calm-heron"]}
+    fast = serializers.dumps_json(body)
+
+    monkeypatch.setattr(serializers, "orjson", None)
+    assert serializers.dumps_json(body) == fast
+    assert json.loads(fast) == body
+
+
+def test_text_serializer_writes_one_name_per_line():
+    assert serializers.serialize({"name": "brave-otter"}, serializers.TEXT_MIMETYPE) == b"brave-otter\n"
+    assert serializers.serialize({"names": ["a", "b"]}, serializers.TEXT_MIMETYPE) == b"a\nb\n"
@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+api.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "create_app": created - imported,
+    "opencensus_imported": any(name.startswith("opencensus") for name in sys.modules),
+}))
+"""
+
+
+def measure_startup(**env):
+    environment = {key: value for key, value in os.environ.items() if key != "APPLICATIONINSIGHTS_CONNECTION_STRING"}
+    environment.update(env)
+    output = subprocess.check_output([sys.executable, "-c", STARTUP_SCRIPT], cwd=SRC_DIR, env=environment,
+                                     universal_newlines=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_startup_without_telemetry_is_within_budget():
+    budget = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.5"))
+    startup = measure_startup()
+
+    assert not startup["opencensus_imported"]
+    assert startup["import"] + startup["create_app"] < budget, startup
+
+
+def test_telemetry_is_built_when_a_connection_string_is_set():
+    startup = measure_startup(
+        APPLICATIONINSIGHTS_CONNECTION_STRING="InstrumentationKey=00000000-0000-0000-0000-000000000000;"
+        "IngestionEndpoint=http://127.0.0.1:9"
+    )
+
+    assert startup["opencensus_imported"]
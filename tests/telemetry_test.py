@@ -0,0 +1,211 @@
+import threading
+from unittest.mock import MagicMock
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+from flask import Blueprint, Flask
+from opencensus.common.schedule import Queue
+from opencensus.trace import execution_context
+from opencensus.trace.samplers import AlwaysOffSampler, AlwaysOnSampler, ProbabilitySampler
+from opencensus.trace.span import SpanKind
+from opencensus.trace.span_context import SpanContext
+from opencensus.trace.trace_options import TraceOptions
+
+from src.api import telemetry
+from src.api.admission import AdmissionController
+from src.api.telemetry import ProcessLocalExporter, RateLimitedSampler
+
+
+def test_rate_limited_sampler_caps_traces_per_second():
+    sampler = RateLimitedSampler(5)
+    decisions = [sampler.should_sample(SpanContext()) for _ in range(50)]
+    assert sum(decisions) == 5
+
+
+def test_rate_limited_sampler_keeps_upstream_sampled_traces():
+    sampler = RateLimitedSampler(0)
+    assert sampler.should_sample(SpanContext(trace_options=TraceOptions("1")))
+    assert not sampler.should_sample(SpanContext())
+
+
+def test_build_sampler_from_environment(monkeypatch):
+    monkeypatch.setenv("TRACE_SAMPLER", "probability")
+    monkeypatch.setenv("TRACE_SAMPLING_RATE", "0.25")
+    sampler = telemetry.build_sampler()
+    assert isinstance(sampler, ProbabilitySampler)
+    assert sampler.rate == 0.25
+
+    monkeypatch.setenv("TRACE_SAMPLER", "rate_limited")
+    assert isinstance(telemetry.build_sampler(), RateLimitedSampler)
+
+
+def _sdk_exporter(**options):
+    # Stands in for AzureExporter: the SDK's bounded queue and a running worker thread
+    sdk_exporter = MagicMock(options=options)
+    sdk_exporter._queue = Queue(capacity=options["queue_capacity"])
+    sdk_exporter._worker.is_alive.return_value = True
+    return sdk_exporter
+
+
+def test_process_local_exporter_hands_spans_to_the_sdk_queue():
+    factory = MagicMock(side_effect=_sdk_exporter)
+    exporter = ProcessLocalExporter(factory, capacity=10, max_batch_size=3, export_interval=0.5)
+    assert not exporter.running
+
+    exporter.export(["span"] * 3)
+    exporter.export(["span"])
+
+    factory.assert_called_once_with(queue_capacity=10, max_batch_size=3, export_interval=0.5)
+    assert exporter.running
+    assert len(exporter) == 4
+    assert exporter.exporter._queue.gets(10, 0) == ("span",) * 4
+
+
+def test_process_local_exporter_drops_on_overflow():
+    exporter = ProcessLocalExporter(_sdk_exporter, capacity=2)
+
+    exporter.export(["span"] * 5)
+
+    assert len(exporter) == 2
+    assert exporter.dropped == 3
+
+
+def test_process_local_exporter_creates_an_exporter_per_process():
+    factory = MagicMock(side_effect=_sdk_exporter)
+    exporter = ProcessLocalExporter(factory)
+    exporter.ensure_started()
+    # A worker forked from a preloading master sees the master's pid
+    exporter._pid = -1
+
+    assert not exporter.running
+    exporter.export(["span"])
+
+    assert factory.call_count == 2
+    assert len(exporter) == 1
+
+
+def test_failed_requests_are_exported_when_not_sampled():
+    execution_context.clear()
+    flask = Flask(__name__)
+    exporter = MagicMock()
+    telemetry.register_error_sampling(flask, exporter)
+
+    @flask.route("/fail")
+    def fail():
+        return "failed", 503
+
+    response = flask.test_client().get("/fail")
+
+    assert response.status_code == 503
+    span_data = exporter.export.call_args[0][0][0]
+    assert span_data.attributes["http.status_code"] == 503
+    assert span_data.context.trace_options.get_enabled()
+
+
+def test_build_excludelist_paths_from_environment(monkeypatch):
+    assert telemetry.build_excludelist_paths() == ["healthz", "readyz", "metrics"]
+
+    monkeypatch.setenv("TRACE_EXCLUDED_PATHS", "/internal/, status")
+    assert telemetry.build_excludelist_paths() == ["internal/", "status"]
+
+
+def test_failed_requests_on_excluded_paths_are_not_exported():
+    execution_context.clear()
+    flask = Flask(__name__)
+    exporter = MagicMock()
+    telemetry.register_error_sampling(flask, exporter, ["healthz"])
+
+    @flask.route("/healthz")
+    def healthz():
+        return "failed", 503
+
+    assert flask.test_client().get("/healthz").status_code == 503
+    exporter.export.assert_not_called()
+
+
+def test_requests_shed_by_admission_control_are_not_exported():
+    execution_context.clear()
+    flask = Flask(__name__)
+    exporter = MagicMock()
+    telemetry.register_error_sampling(flask, exporter)
+    bp = Blueprint("names", __name__)
+
+    @bp.route("/names")
+    def names():
+        return "ok"
+
+    flask.register_blueprint(bp)
+    AdmissionController(max_in_flight=1, max_queue_wait=0.1).register(flask, [bp.name])
+
+    response = flask.test_client().get("/names", headers={"X-Request-Start": "t=1"})
+
+    assert response.status_code == 503
+    exporter.export.assert_not_called()
+
+
+def _traced_asgi_app(exporter, sampler):
+    fastapi = FastAPI()
+    trace_ids = []
+
+    @fastapi.get("/names/{key}")
+    def name(key: str):
+        # The route runs in a worker thread, like the sync routes of the names service
+        trace_ids.append(execution_context.get_opencensus_tracer().span_context.trace_id)
+        return PlainTextResponse(key)
+
+    @fastapi.get("/fail")
+    async def fail():
+        return PlainTextResponse("failed", status_code=503)
+
+    @fastapi.get("/healthz")
+    async def healthz():
+        return PlainTextResponse("failed", status_code=503)
+
+    @fastapi.get("/shed")
+    async def shed(request: Request):
+        request.state.admission_shed = True
+        return PlainTextResponse("overloaded", status_code=503)
+
+    telemetry.register_asgi_tracing(fastapi, exporter, sampler, ["healthz"])
+
+    return TestClient(fastapi), trace_ids
+
+
+def test_asgi_requests_are_traced_from_their_traceparent():
+    exporter = MagicMock()
+    client, trace_ids = _traced_asgi_app(exporter, AlwaysOnSampler())
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+    response = client.get("/names/a", headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"})
+
+    assert response.status_code == 200
+    assert trace_ids == [trace_id]
+    span_data = exporter.export.call_args[0][0][0]
+    assert span_data.context.trace_id == trace_id
+    assert span_data.parent_span_id == "00f067aa0ba902b7"
+    assert span_data.span_kind == SpanKind.SERVER
+    assert span_data.attributes["http.route"] == "/names/{key}"
+    assert span_data.attributes["http.status_code"] == 200
+
+
+def test_asgi_failed_requests_are_exported_when_not_sampled():
+    exporter = MagicMock()
+    client, _ = _traced_asgi_app(exporter, AlwaysOffSampler())
+
+    assert client.get("/names/a").status_code == 200
+    exporter.export.assert_not_called()
+
+    assert client.get("/fail").status_code == 503
+    span_data = exporter.export.call_args[0][0][0]
+    assert span_data.attributes["http.status_code"] == 503
+    assert span_data.context.trace_options.get_enabled()
+
+
+def test_asgi_shed_and_excluded_requests_are_not_exported():
+    exporter = MagicMock()
+    client, _ = _traced_asgi_app(exporter, AlwaysOffSampler())
+
+    assert client.get("/shed").status_code == 503
+    assert client.get("/healthz").status_code == 503
+    exporter.export.assert_not_called()
@@ -0,0 +1,72 @@
+import multiprocessing
+
+import pytest
+
+from src.api.names import NAME_SPACE
+from src.api.unique import HEADER, SharedNameFilter
+
+
+def test_names_do_not_repeat_within_the_window():
+    name_filter = SharedNameFilter(window_count=20000)
+
+    names = [name_filter.draw() for _ in range(20000)]
+
+    assert len(set(names)) == len(names)
+    assert name_filter.drawn == 20000
+
+
+def test_taken_names_are_redrawn(monkeypatch):
+    name_filter = SharedNameFilter(window_count=10)
+    indexes = iter([5, 5, 7])
+    monkeypatch.setattr(name_filter._rng, "randrange", lambda _: next(indexes))
+
+    assert name_filter.draw() != name_filter.draw()
+    assert name_filter.redraws == 1
+
+
+def test_generations_rotate_once_the_window_is_full():
+    name_filter = SharedNameFilter(window_count=2)
+    for _ in range(5):
+        name_filter.draw()
+
+    generation, count, _ = HEADER.unpack_from(name_filter._map, 0)
+    assert (generation, count) == (2, 1)
+
+
+def _draw_in_worker(name_filter, count, output):
+    with open(output, "w", encoding="utf-8") as w_stream:
+        w_stream.write("\n".join(name_filter.draw() for _ in range(count)))
+    with open(f"{output}.redraws", "w", encoding="utf-8") as w_stream:
+        w_stream.write(str(name_filter.redraws))
+
+
+def test_workers_share_the_filter_through_its_file(tmp_path):
+    # Built before the fork, like a gunicorn master preloading the app
+    name_filter = SharedNameFilter(path=str(tmp_path / "filter"), window_count=20000)
+    outputs = [str(tmp_path / f"names-{i}") for i in range(2)]
+    workers = [
+        multiprocessing.get_context("fork").Process(target=_draw_in_worker, args=(name_filter, 5000, output))
+        for output in outputs
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    names = []
+    redraws = 0
+    for output in outputs:
+        with open(output, "r", encoding="utf-8") as r_stream:
+            names.extend(r_stream.read().splitlines())
+        with open(f"{output}.redraws", "r", encoding="utf-8") as r_stream:
+            redraws += int(r_stream.read())
+
+    assert len(names) == 10000
+    assert len(set(names)) == 10000
+    # Workers with the same RNG state would redraw almost every name the other one drew
+    assert redraws < 100
+
+
+def test_window_count_is_bounded_by_the_name_space():
+    with pytest.raises(ValueError):
+        SharedNameFilter(window_count=NAME_SPACE)